@@ -0,0 +1,62 @@
+import os
+import tempfile
+import time
+
+from remove_background import DEFAULT_MODEL, remove_file, start_workers
+from resize_images import find_images
+
+RESOURCES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "resources")
+
+
+def candidate_splits(cpus=None):
+    """
+    Every workers x threads split using all the CPUs, e.g. 1x8, 2x4, 4x2 and 8x1 for 8 CPUs.
+    """
+    cpus = cpus or os.cpu_count()
+    return [(workers, cpus // workers) for workers in range(1, cpus + 1) if cpus % workers == 0]
+
+
+def benchmark_splits(folder=RESOURCES_FOLDER, splits=None, model_name=DEFAULT_MODEL, rounds=2):
+    """
+    Measures the images per second of remove_background_folder for each workers x threads split.
+    The model loading of the workers is left out: the first images warm the sessions up,
+    then the sample images are processed `rounds` times.
+
+    Run as:
+    python benchmark_remove_background.py
+
+    """
+    paths = sorted(find_images(folder))
+    splits = splits or candidate_splits()
+    print(f"####### Background removal benchmark on [{len(paths)}] images of [{folder}] #######")
+    rates = {}
+    with tempfile.TemporaryDirectory() as output_folder:
+        for workers, threads in splits:
+            with start_workers(workers, threads, model_name) as executor:
+                # Enough tasks at once to start every worker, each one loading its session
+                warm_up = (paths * workers)[:workers]
+                list(executor.map(remove_file, warm_up, output_paths(warm_up, output_folder)))
+
+                sample = paths * rounds
+                start = time.perf_counter()
+                results = list(executor.map(remove_file, sample, output_paths(sample, output_folder)))
+                elapsed = time.perf_counter() - start
+
+            errors = sum(1 for _, _, error in results if error)
+            rates[(workers, threads)] = len(sample) / elapsed
+            print(
+                f"{workers} workers x {threads} threads: [{rates[(workers, threads)]:.2f}] images/s "
+                f"- [{elapsed:.1f}] s - [{errors}] errors"
+            )
+
+    best = max(rates, key=rates.get)
+    print(f"=====> Best split: {best[0]} workers x {best[1]} threads - [{rates[best]:.2f}] images/s")
+    return rates
+
+
+def output_paths(paths, output_folder):
+    return [os.path.join(output_folder, f"{number}.png") for number in range(len(paths))]
+
+
+if __name__ == "__main__":
+    benchmark_splits()
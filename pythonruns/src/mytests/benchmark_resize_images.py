@@ -0,0 +1,72 @@
+import io
+import os
+import time
+
+from PIL import Image
+from resize_images import JPG_QUALITIES, estimate_jpg_quality, find_jpg_quality
+
+RESOURCES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "resources")
+
+
+def linear_quality_search(img, max_size_kb):
+    """
+    The original search of compress_jpg: quality 95, 90, 85... until the encoding fits.
+    :return: Chosen quality and number of encodes
+    """
+    quality, encodes, img_size = 95, 0, None
+    while (img_size is None or img_size > max_size_kb) and quality > 10:
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=quality, optimize=True)
+        img_size = buffer.tell() / 1024
+        encodes += 1
+        quality -= 5
+    return quality + 5, encodes
+
+
+def benchmark_quality_search(folder=RESOURCES_FOLDER, budget_ratio=0.5):
+    """
+    Compares the linear quality descent with the bisection solver on the sample images,
+    using a size budget of budget_ratio times the quality 95 encoding of each image.
+
+    Run as:
+    python benchmark_resize_images.py
+
+    """
+    print(f"####### JPG quality search benchmark on [{folder}] #######")
+    totals = {"linear": [0, 0.0], "bisection": [0, 0.0]}
+    for file in sorted(os.listdir(folder)):
+        if not file.lower().endswith((".jpg", ".jpeg", ".png")):
+            continue
+        with Image.open(os.path.join(folder, file)) as original:
+            img = original.convert("RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=95, optimize=True)
+        original_kb = buffer.tell() / 1024
+        max_size_kb = original_kb * budget_ratio
+
+        start = time.perf_counter()
+        linear_quality, linear_encodes = linear_quality_search(img, max_size_kb)
+        linear_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        seed = estimate_jpg_quality(img, original_kb, max_size_kb)
+        _, quality, encodes = find_jpg_quality(img, "JPEG", max_size_kb, JPG_QUALITIES, seed)
+        bisection_time = time.perf_counter() - start
+
+        totals["linear"][0] += linear_encodes
+        totals["linear"][1] += linear_time
+        totals["bisection"][0] += encodes
+        totals["bisection"][1] += bisection_time
+        print(
+            f"{file}: [{round(max_size_kb, 2)}] Kb budget - linear: quality [{linear_quality}] "
+            f"[{linear_encodes}] encodes [{linear_time * 1000:.1f}] ms - bisection: quality [{quality}] "
+            f"[{encodes}] encodes [{bisection_time * 1000:.1f}] ms"
+        )
+
+    for name, (encodes, elapsed) in totals.items():
+        print(f"=====> {name}: [{encodes}] encodes in [{elapsed * 1000:.1f}] ms")
+    return totals
+
+
+if __name__ == "__main__":
+    benchmark_quality_search()
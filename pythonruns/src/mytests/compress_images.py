@@ -1,7 +1,32 @@
 import os
 import subprocess
-
-from resize_images import resize_image
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from resize_images import (
+    CONVERT_FORMATS,
+    IMAGE_ERRORS,
+    ImageCache,
+    ImageResult,
+    cache_settings,
+    convert_image,
+    converted_path,
+    find_images,
+    find_quality,
+    hash_result,
+    print_progress,
+    print_summary,
+    resize_image,
+    split_cached,
+    supported_formats,
+    write_file_atomic,
+)
+
+# Quality steps for mozjpeg, the first try is 85 and it never goes above it
+CJPEG_QUALITIES = tuple(range(15, 86, 5))
+CJPEG_FIRST_QUALITY = 85
+# Failures of one file turned into an "error" record, cjpeg failing on it included
+TASK_ERRORS = (*IMAGE_ERRORS, subprocess.CalledProcessError)
 
 
 def compress_jpeg(input_path, max_size_kb):
@@ -9,7 +34,7 @@ def compress_jpeg(input_path, max_size_kb):
     Compress images files to a defined size/quality.
 
     Run as:
-    python compress_images.py /path/to/folder --max_size_kb 100
+    python compress_images.py /path/to/folder --max_size_kb 100 --workers 8
 
     """
 
@@ -18,50 +43,143 @@ def compress_jpeg(input_path, max_size_kb):
     img_size = os.path.getsize(input_path) / 1024  # Get image size in KB
 
     if img_size <= max_size_kb:
-        return
+        return ImageResult(input_path, "skipped", img_size, img_size)
+
+    # Read the file once, every quality step pipes it through cjpeg without temp files
+    with open(input_path, "rb") as f:
+        input_bytes = f.read()
+
+    # Try 85 first (one encode when it fits), then bisect the lower qualities
+    output_bytes, quality, encodes = find_quality(
+        lambda q: cjpeg(input_bytes, q), max_size_kb, CJPEG_QUALITIES, seed=CJPEG_FIRST_QUALITY
+    )
+    new_size = len(output_bytes) / 1024  # Size in KB
+
+    # If the new file fits, replace the original file (written once to a temp file, then moved over it)
+    if new_size > max_size_kb:
+        return ImageResult(input_path, "unchanged", img_size, img_size, encodes=encodes)
+
+    print(f"----> Final size for file [{input_path}] - [{round(new_size,2)}] Kb - quality [{quality}].")
+    write_file_atomic(input_path, output_bytes)
+    return ImageResult(input_path, "compressed", img_size, new_size, quality, encodes)
+
+
+def cjpeg(input_bytes, quality):
+    """
+    Compress using mozjpeg, the image goes in through stdin and comes back through stdout.
+    """
+    process = subprocess.run(["cjpeg", "-quality", str(quality)], input=input_bytes, capture_output=True, check=True)
+    return process.stdout
+
 
-    output_path = input_path + ".tmp.jpg"
+def compress_png(input_path, max_size_kb, lossy=True):
+    # Lossless zlib strategy search, then adaptive palette quantization if allowed (see resize_images.optimize_png)
+    return resize_image(input_path, max_size_kb, png_lossy=lossy)
 
-    # Compress using mozjpeg
-    subprocess.run(["cjpeg", "-quality", "85", "-outfile", output_path, input_path])
 
-    # Check the size of the new file
-    new_size = os.path.getsize(output_path) / 1024  # Size in KB
+def compress_image(input_path, max_size_kb, png_lossy=True):
+    """
+    Task of the pool: compress one image, turning any failure into an "error" record.
+    """
+    try:
+        if input_path.lower().endswith((".jpg", ".jpeg")):
+            return hash_result(compress_jpeg(input_path, max_size_kb))
+        return hash_result(compress_png(input_path, max_size_kb, png_lossy))
+    except TASK_ERRORS as e:
+        return ImageResult(input_path, "error", error=f"{type(e).__name__}: {e}")
 
-    # If the new file is smaller, replace the original file
-    if new_size <= max_size_kb:
-        print(f"----> Final size for file [{input_path}] - [{round(new_size,2)}] Kb.")
-        os.replace(output_path, input_path)
-    else:
-        os.remove(output_path)
-        # Reduce quality step by step
-        quality = 80
-        while new_size > max_size_kb and quality > 10:
-            subprocess.run(["cjpeg", "-quality", str(quality), "-outfile", output_path, input_path])
-            new_size = os.path.getsize(output_path) / 1024  # Size in KB
-            quality -= 5
 
-        if new_size <= max_size_kb:
-            print(f"----> Final size for file [{input_path}] - [{round(new_size,2)}] Kb - quality [{quality}].")
-            os.replace(output_path, input_path)
-        else:
-            os.remove(output_path)
+def convert_task(input_path, max_size_kb, image_format, replace):
+    """
+    Task of the pool: convert one image, turning any failure into an "error" record.
+    """
+    try:
+        return hash_result(convert_image(input_path, max_size_kb, image_format, replace))
+    except TASK_ERRORS as e:
+        return ImageResult(input_path, "error", error=f"{type(e).__name__}: {e}")
 
 
-def compress_png(input_path, max_size_kb):
-    # Currently no advanced PNG compression here, but could use pngquant or optipng in a similar way to mozjpeg
-    resize_image(input_path, max_size_kb)
+def process_images(folder, max_size_kb=100, workers=None, use_cache=True, png_lossy=True):
+    """
+    Compresses all the images of a folder, several at the same time.
+    The heavy work runs in the cjpeg subprocesses, so a thread pool is enough to keep
+    at most `workers` of them running at once (Pillow also releases the GIL while encoding the PNGs).
+    Files already processed (see ImageCache) are skipped.
+    :param folder: Folder to search for images
+    :param max_size_kb: Max image size in KB
+    :param workers: Number of images compressed at the same time, defaults to the number of CPUs
+    :param use_cache: Keep and use the result cache in the folder
+    :param png_lossy: Allow palette quantization for PNGs that do not fit losslessly
+    :return: One ImageResult per image file
+    """
+    settings = cache_settings(max_size_kb, encoder="cjpeg", png_lossy=png_lossy)
+    return run_tasks(folder, compress_image, (max_size_kb, png_lossy), settings, workers, use_cache)
 
 
-def process_images(folder, max_size_kb=100):
-    print(f"========== Resizing images... ==========")
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if file.lower().endswith((".jpg", ".jpeg")):
-                compress_jpeg(file_path, max_size_kb)
-            elif file.lower().endswith(".png"):
-                compress_png(file_path, max_size_kb)
+def convert_images(
+    folder, formats=tuple(CONVERT_FORMATS), max_size_kb=100, workers=None, use_cache=True, replace=False
+):
+    """
+    Converts all the images of a folder to web formats, each one at the highest quality fitting max_size_kb
+    (and never bigger than the original), with a summary of the Kb saved per format.
+    Formats Pillow can not write here (e.g. AVIF without its plugin) are left out.
+    :param folder: Folder to search for images
+    :param formats: Pillow formats to convert to, "WEBP" and/or "AVIF"
+    :param max_size_kb: Max converted image size in KB
+    :param workers: Number of images converted at the same time, defaults to the number of CPUs
+    :param use_cache: Keep and use the result cache in the folder (not possible when replacing)
+    :param replace: Delete the originals once converted, only with a single format and without two images
+        differing by their extension only (photo.jpg and photo.png would both become photo.webp)
+    :return: One list of ImageResult per format
+    """
+    formats = supported_formats(formats)
+    if replace and len(formats) != 1:
+        raise ValueError(f"Replacing the originals needs exactly one supported format, got {formats}")
+    if replace:
+        targets = Counter(converted_path(path, formats[0], replace) for path in find_images(folder))
+        clashes = sorted(path for path, count in targets.items() if count > 1)
+        if clashes:
+            raise ValueError(f"Replacing the originals would convert several images to {clashes}")
+    results = {}
+    for image_format in formats:
+        settings = cache_settings(max_size_kb, convert=image_format)
+        results[image_format] = run_tasks(
+            folder,
+            convert_task,
+            (max_size_kb, image_format, replace),
+            settings,
+            workers,
+            use_cache and not replace,
+            title=f"{image_format} done",
+            output_path=lambda path, image_format=image_format: converted_path(path, image_format, replace),
+        )
+    return results
+
+
+def run_tasks(folder, task, args, settings, workers=None, use_cache=True, title="Done", output_path=None):
+    """
+    Runs task(path, *args) for every image of a folder in a thread pool, skipping the cached ones.
+    :param output_path: For tasks writing a new file, function giving its path (see ImageCache.lookup)
+    :return: One ImageResult per image file
+    """
+    cache = ImageCache(folder) if use_cache else None
+    results, paths = split_cached(list(find_images(folder)), cache, settings, output_path)
+    total = len(paths)
+    print(f"========== Processing {total} images with {workers or os.cpu_count()} workers... ==========")
+    try:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = [executor.submit(task, path, *args) for path in paths]
+            for count, future in enumerate(futures, 1):
+                result = future.result()
+                results.append(result)
+                print_progress(count, total, result)
+                if cache:
+                    cache.store(result, settings)
+    finally:
+        if cache:
+            cache.close()
+    print_summary(results, title)
+    return results
 
 
 if __name__ == "__main__":
@@ -70,7 +188,20 @@ if __name__ == "__main__":
     # parser.add_argument("folder", type=str, help="Folder to search for images")
     # parser.add_argument("--max_size_kb", type=int, default=100,
     #                     help="Maximum image size in KB (default: 100KB)")
+    # parser.add_argument("--workers", type=int, default=None,
+    #                     help="Images compressed at the same time (default: number of CPUs)")
+    # parser.add_argument("--no-cache", action="store_true",
+    #                     help="Process every file again, ignoring the cache")
+    # parser.add_argument("--png_lossless", action="store_true",
+    #                     help="Never quantize PNGs to a palette")
+    # parser.add_argument("--convert", nargs="+", choices=list(CONVERT_FORMATS),
+    #                     help="Convert to these web formats instead of compressing")
+    # parser.add_argument("--replace", action="store_true",
+    #                     help="Delete the originals once converted (single format only)")
     # args = parser.parse_args()
     #
-    # process_images(args.folder, args.max_size_kb)
+    # if args.convert:
+    #     convert_images(args.folder, args.convert, args.max_size_kb, args.workers, not args.no_cache, args.replace)
+    # else:
+    #     process_images(args.folder, args.max_size_kb, args.workers, not args.no_cache, not args.png_lossless)
     process_images("/home/my_user/Pictures/Webcam/", 75)
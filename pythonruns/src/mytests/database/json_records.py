@@ -0,0 +1,113 @@
+import json
+from bisect import insort
+from operator import itemgetter
+
+# Table of the JSON demos: one row per record, the id column being the record id
+# and the data column the other fields of the record as a JSON object (queried with the JSON1 functions)
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS json_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data TEXT NOT NULL CHECK (json_valid(data) AND json_type(data) = 'object')
+)
+"""
+
+# Key of the decoded document in the StoreCache of a demo
+STORE_KEY = "store"
+
+# Each record as JSON text, its id put back first. Spliced as text (json_patch would drop the null fields):
+# the data column always holds a json.dumps object (see record_row), so it starts with "{"
+RECORD_JSON = """'{"id":' || id || iif(data = '{}', '}', ',' || substr(data, 2))"""
+
+
+def create_table(conn):
+    conn.execute(CREATE_TABLE)
+    conn.commit()
+
+
+def read_store(cursor):
+    """
+    All the records as the {"data": [...]} document of the JSON files, ordered by id.
+    The document is built by SQLite: the id put back first in each record, then one array of all of them.
+    json_group_array(... ORDER BY id) needs SQLite 3.44: the array follows the order of the ordered subquery
+    instead, which SQLite keeps but SQL does not promise (test_read_data_keeps_id_order checks it).
+    """
+    cursor.execute(
+        f"SELECT json_group_array(json(record)) FROM (SELECT {RECORD_JSON} AS record FROM json_data ORDER BY id)"
+    )
+    return {"data": json.loads(cursor.fetchone()[0])}
+
+
+class RecordStore:
+    """
+    The records of the json_data table of a demo as the {"data": [...]} document of the JSON files:
+    read through its StoreCache, appended one at a time through its GroupCommit.
+    """
+
+    def __init__(self, cursor, writes, cache):
+        self.cursor = cursor
+        self.writes = writes
+        self.cache = cache
+
+    def load(self):
+        """
+        The document, decoded once then read from the cache.
+        Its list is a copy, which the appends do not change, the records being shared: they must not be modified.
+        """
+        return {"data": list(self.cache.get(STORE_KEY, self.read)["data"])}
+
+    def read(self):
+        with self.writes.read():
+            return read_store(self.cursor)
+
+    def append(self, record):
+        """
+        Adds one record, without reading or rewriting the others, and brings the cached document up to date.
+        :return: The id of the record, given by the database when it has none
+        """
+        record_id = self.cache.write(
+            STORE_KEY,
+            lambda: self.writes.execute("INSERT INTO json_data (id, data) VALUES (?, ?)", record_row(record)).lastrowid,
+            lambda store, new_id: add_to_store(store, record, new_id),
+        )
+        # The query results may have changed
+        self.cache.invalidate_if(lambda key: key != STORE_KEY)
+        return record_id
+
+
+def add_to_store(store, record, record_id):
+    """
+    The decoded store with a record saved under an id, still ordered by id.
+    """
+    insort(store["data"], {"id": record_id, **record_row_fields(record)}, key=itemgetter("id"))
+    return store
+
+
+def record_row(record):
+    """
+    Row of a record: its id (None for a new one) and its other fields as JSON.
+    The id is the integer primary key of the row: anything else raises a ValueError (SQLite would raise
+    an IntegrityError for a string id, or store a float one rounded).
+    """
+    record_id = record.get("id")
+    if record_id is not None and (not isinstance(record_id, int) or isinstance(record_id, bool)):
+        raise ValueError(f"Invalid record id {record_id!r}: the ids of the records must be integers")
+    return record_id, json.dumps(record_row_fields(record))
+
+
+def record_rows(records):
+    """
+    Rows of the records of a document replacing all of them (see record_row), streamed.
+    The ids of the document are kept, so an id given to two records raises a ValueError.
+    """
+    ids = set()
+    for record in records:
+        record_id, data = record_row(record)
+        if record_id is not None:
+            if record_id in ids:
+                raise ValueError(f"Invalid record id {record_id}: it is given to several records")
+            ids.add(record_id)
+        yield record_id, data
+
+
+def record_row_fields(record):
+    return {key: value for key, value in record.items() if key != "id"}
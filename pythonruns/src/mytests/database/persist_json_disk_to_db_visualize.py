@@ -1,57 +1,188 @@
 import json
-import sqlite3
+import re
+import time
 import tkinter as tk
+from itertools import islice
 from tkinter import filedialog, messagebox
 
-# Initialize the in-memory SQLite database
-conn = sqlite3.connect(":memory:")
-cursor = conn.cursor()
-
-# Create a table to store JSON data
-cursor.execute(
-    """
-CREATE TABLE IF NOT EXISTS json_data (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    data TEXT NOT NULL
-)
-"""
+from json_records import (
+    RECORD_JSON,
+    STORE_KEY,
+    RecordStore,
+    create_table,
+    record_rows,
 )
-conn.commit()
+from sqlite_backend import GroupCommit, connect, database_path
+from store_cache import StoreCache
+
+# Records inserted by one executemany call of an import
+IMPORT_BATCH_SIZE = 10000
+# Characters read from the JSON file at a time by the incremental parser
+READ_CHUNK_SIZE = 1 << 20
+# Characters the incremental parser buffers at most for one value, past it the document is rejected as invalid
+# (a corrupt token would otherwise be taken for a value cut by the end of the buffer until the end of the file)
+MAX_PENDING_SIZE = 4 * READ_CHUNK_SIZE
+# Rows fetched from the database at a time by an export
+EXPORT_BATCH_SIZE = 10000
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Characters a number can be followed by in a JSON document
+NUMBER_DELIMITERS = frozenset(" \t\n\r,]}")
+JSON_FILE_TYPES = [("JSON files", "*.json"), ("JSON Lines files", "*.jsonl *.ndjson")]
+
+# Initialize the SQLite database of the demo: a WAL journaled file, kept across runs (see sqlite_backend.DB_FOLDER)
+conn = connect(database_path("persist_json_disk_to_db_visualize"))
+cursor = conn.cursor()
+# Every write goes through the group commit, the writes of a short window being committed at once
+writes = GroupCommit(conn)
+# Decoded store and query results, kept up to date by the writes of this module (see store_cache.StoreCache)
+cache = StoreCache()
 
-# Initialize the JSON storage in the database (if empty)
-initial_data = {"data": []}
-cursor.execute("INSERT INTO json_data (data) VALUES (?)", (json.dumps(initial_data),))
-conn.commit()
+# Create the table of the records if needed (see json_records.CREATE_TABLE)
+create_table(conn)
 
+# Functions to load JSON data from the database, as the {"data": [...]} document of the JSON files (read through
+# the cache, or straight from the table), and to add one record without reading or rewriting the others
+json_store = RecordStore(cursor, writes, cache)
+load_data_from_db = json_store.load
+read_data_from_db = json_store.read
+append_record = json_store.append
 
-# Function to load JSON data from the database
-def load_data_from_db():
-    cursor.execute("SELECT data FROM json_data WHERE id = 1")
-    row = cursor.fetchone()
-    if row:
-        return json.loads(row[0])
-    else:
-        return {"data": []}
 
-
-# Function to save JSON data back to the database
+# Function to save JSON data back to the database, replacing all the records
 def save_data_to_db(data):
-    cursor.execute("UPDATE json_data SET data = ? WHERE id = 1", (json.dumps(data),))
-    conn.commit()
+    import_records(data["data"])
+
+
+# Function to replace all the records by a stream of them, in batches of executemany inserts.
+# One transaction: an import failing halfway leaves the previous records untouched, e.g. on the ValueError
+# of an id that is not an integer or given to several records (see json_records.record_rows).
+def import_records(records, batch_size=IMPORT_BATCH_SIZE):
+    rows = record_rows(records)
+
+    def replace_records():
+        count = 0
+        with writes.transaction():
+            cursor.execute("DELETE FROM json_data")
+            for batch in iter(lambda: list(islice(rows, batch_size)), []):
+                cursor.executemany("INSERT INTO json_data (id, data) VALUES (?, ?)", batch)
+                count += len(batch)
+        return count
+
+    # Dirty while the records are replaced, then every cached value is stale
+    count = cache.write(STORE_KEY, replace_records)
+    cache.invalidate()
+    return count
+
+
+# Stream the records of a JSON file one at a time, memory staying bounded whatever its size:
+# JSON Lines (.jsonl/.ndjson) line by line, otherwise the items of the "data" array of the {"data": [...]} document
+def iter_json_records(file_path, key="data", chunk_size=READ_CHUNK_SIZE):
+    with open(file_path, "r", encoding="utf-8") as json_file:
+        if file_path.lower().endswith((".jsonl", ".ndjson")):
+            for line in json_file:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        yield from iter_json_array(json_file, key, chunk_size)
+
+
+# Incremental parser of the array of one key of a top level JSON object: the file is read chunk by chunk,
+# each item is decoded on its own by raw_decode, the other keys are skipped.
+# Raises ValueError for an invalid document, a value of the key that is not an array,
+# or a value (item or skipped one) longer than max_pending characters.
+def iter_json_array(json_file, key="data", chunk_size=READ_CHUNK_SIZE, max_pending=MAX_PENDING_SIZE):
+    decoder = json.JSONDecoder()
+    buffer, position, end_of_file = "", 0, False
+
+    def read_chunk():
+        nonlocal buffer, position, end_of_file
+        chunk = json_file.read(chunk_size)
+        buffer, position, end_of_file = buffer[position:] + chunk, 0, not chunk
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            position = WHITESPACE.match(buffer, position).end()
+            if position < len(buffer) or end_of_file:
+                return buffer[position : position + 1]
+            read_chunk()
+
+    def decode():
+        # Values cut by the end of the buffer are decoded again once the next chunk is read, so are the ones ending
+        # it, and the numbers not followed by a delimiter: raw_decode reads "1" out of "1." or "1e" cut by the chunk
+        nonlocal position
+        skip_whitespace()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if end_of_file or (end < len(buffer) and (not number or buffer[end] in NUMBER_DELIMITERS)):
+                    position = end
+                    return value
+            except json.JSONDecodeError:
+                if end_of_file:
+                    raise
+            if len(buffer) - position > max_pending:
+                raise ValueError(f"Invalid JSON document: no value in the next {max_pending} characters")
+            read_chunk()
+
+    def expect(characters):
+        nonlocal position
+        character = skip_whitespace()
+        if not character or character not in characters:
+            raise ValueError(f"Invalid JSON document: expected one of [{characters}], got [{character}]")
+        position += 1
+        return character
+
+    expect("{")
+    if skip_whitespace() == "}":
+        return
+    while True:
+        name = decode()
+        expect(":")
+        if name == key:
+            if skip_whitespace() != "[":
+                raise ValueError(f"Invalid JSON document: the value of [{key}] is not an array")
+            position += 1
+            if skip_whitespace() == "]":
+                return
+            while True:
+                yield decode()
+                if expect(",]") == "]":
+                    return
+        decode()
+        if expect(",}") == "}":
+            return
+
+
+# Write the records to a JSON file from the database cursor, EXPORT_BATCH_SIZE rows at a time:
+# JSON Lines for a .jsonl/.ndjson path, otherwise the {"data": [...]} document with one record per line.
+# The records are written as SQLite gives them, never decoded in Python. The writes wait for the end of the export.
+def export_records(file_path, batch_size=EXPORT_BATCH_SIZE):
+    json_lines = file_path.lower().endswith((".jsonl", ".ndjson"))
+    count = 0
+    with open(file_path, "w", encoding="utf-8") as json_file, writes.read():
+        export_cursor = conn.cursor()
+        export_cursor.arraysize = batch_size
+        export_cursor.execute(f"SELECT {RECORD_JSON} FROM json_data ORDER BY id")
+        separator = "\n" if json_lines else ",\n        "
+        if not json_lines:
+            json_file.write('{\n    "data": [\n        ')
+        for rows in iter(export_cursor.fetchmany, []):
+            json_file.write((separator if count else "") + separator.join(row[0] for row in rows))
+            count += len(rows)
+        json_file.write("\n" if json_lines else "\n    ]\n}\n")
+        export_cursor.close()
+    return count
 
 
 # Function to save data to the "JSON database"
 def save_data():
     info = entry.get()
     if info:
-        # Load existing data from the database
-        data_store = load_data_from_db()
-
-        # Append new data to the in-memory data store
-        data_store["data"].append({"id": len(data_store["data"]) + 1, "info": info})
-
-        # Persist updated data back to the database
-        save_data_to_db(data_store)
+        # Insert one row, its id is given by the database
+        with writes.committed():
+            append_record({"info": info})
 
         entry.delete(0, tk.END)
         messagebox.showinfo("Success", "Data saved successfully!")
@@ -69,25 +200,24 @@ def retrieve_data():
         messagebox.showinfo("No Data", "No data found in the database.")
 
 
-# Function to save the JSON data to a file on disk
+# Function to save the JSON data to a file on disk, streamed from the database
 def save_json_to_disk():
-    data_store = load_data_from_db()
-    file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+    file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=JSON_FILE_TYPES)
     if file_path:
-        with open(file_path, "w") as json_file:
-            json.dump(data_store, json_file, indent=4)
+        start = time.perf_counter()
+        count = export_records(file_path)
+        print(f"----> [{count}] records exported in [{time.perf_counter() - start:.2f}] s")
         messagebox.showinfo("Success", f"Data saved to {file_path} successfully!")
 
 
-# Function to load JSON data from a file on disk
+# Function to load JSON data from a file on disk, streamed into the database
 def load_json_from_disk():
-    file_path = filedialog.askopenfilename(filetypes=[("JSON files", "*.json")])
+    file_path = filedialog.askopenfilename(filetypes=JSON_FILE_TYPES)
     if file_path:
         try:
-            with open(file_path, "r") as json_file:
-                data_store = json.load(json_file)
-            # Persist loaded data to the database
-            save_data_to_db(data_store)
+            start = time.perf_counter()
+            count = import_records(iter_json_records(file_path))
+            print(f"----> [{count}] records imported in [{time.perf_counter() - start:.2f}] s")
             messagebox.showinfo("Success", f"Data loaded from {file_path} successfully!")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load data: {e}")
@@ -95,12 +225,12 @@ def load_json_from_disk():
 
 # Function to view the raw JSON data stored in the database
 def view_db_data():
-    # Directly query the raw JSON data from the table and print it
-    cursor.execute("SELECT * FROM json_data")
-    rows = cursor.fetchall()
+    # Directly query the raw JSON data from the table and print it, row by row
     print("Database Content:")
-    for row in rows:
-        print(f"ID: {row[0]}, Data: {row[1]}")  # Print each row in the console
+    with writes.read():
+        for row in cursor.execute("SELECT * FROM json_data"):
+            print(f"ID: {row[0]}, Data: {row[1]}")  # Print each row in the console
+    print(f"Cache: {cache.stats()}")
 
 
 # Main application setup
@@ -139,7 +269,8 @@ def main():
     # Start the application
     app.mainloop()
 
-    # Close database connection when the app is closed
+    # Commit the pending writes and close database connection when the app is closed
+    writes.close()
     conn.close()
 
 
@@ -1,58 +1,82 @@
 import json
-import sqlite3
 import tkinter as tk
 from tkinter import messagebox
 
-# Initialize the in-memory SQLite database
-conn = sqlite3.connect(":memory:")
-cursor = conn.cursor()
-
-# Create a table to store JSON data
-cursor.execute(
-    """
-CREATE TABLE IF NOT EXISTS json_data (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    data TEXT NOT NULL
+from json_records import (
+    RECORD_JSON,
+    STORE_KEY,
+    RecordStore,
+    create_table,
+    record_rows,
 )
-"""
-)
-conn.commit()
+from sqlite_backend import GroupCommit, connect, database_path
+from store_cache import StoreCache
 
-# Initialize the JSON storage in the database (if empty)
-initial_data = {"data": []}
-cursor.execute("INSERT INTO json_data (data) VALUES (?)", (json.dumps(initial_data),))
-conn.commit()
+# Initialize the SQLite database of the demo: a WAL journaled file, kept across runs (see sqlite_backend.DB_FOLDER)
+conn = connect(database_path("persist_json_to_db"))
+cursor = conn.cursor()
+# Every write goes through the group commit, the writes of a short window being committed at once
+writes = GroupCommit(conn)
+# Decoded store and query results, kept up to date by the writes of this module (see store_cache.StoreCache)
+cache = StoreCache()
 
+# Create the table of the records if needed (see json_records.CREATE_TABLE)
+create_table(conn)
 
-# Function to load JSON data from the database
-def load_data_from_db():
-    cursor.execute("SELECT data FROM json_data WHERE id = 1")
-    row = cursor.fetchone()
-    if row:
-        return json.loads(row[0])
-    else:
-        return {"data": []}
+# Functions to load JSON data from the database, as the {"data": [...]} document of the JSON files (read through
+# the cache, or straight from the table), and to add one record without reading or rewriting the others
+json_store = RecordStore(cursor, writes, cache)
+load_data_from_db = json_store.load
+read_data_from_db = json_store.read
+append_record = json_store.append
 
 
-# Function to save JSON data back to the database
+# Function to save JSON data back to the database, replacing all the records.
+# Raises ValueError for an id that is not an integer or given to several records, the records being left untouched.
 def save_data_to_db(data):
-    cursor.execute("UPDATE json_data SET data = ? WHERE id = 1", (json.dumps(data),))
-    conn.commit()
+    def replace_records():
+        with writes.transaction():
+            cursor.execute("DELETE FROM json_data")
+            cursor.executemany("INSERT INTO json_data (id, data) VALUES (?, ?)", record_rows(data["data"]))
+
+    # Dirty while the records are replaced, then every cached value is stale
+    cache.write(STORE_KEY, replace_records)
+    cache.invalidate()
+
+
+# Function to find the records with a field of a given value, filtered by SQLite with json_extract
+def find_records(field, value):
+    def query():
+        with writes.read():
+            cursor.execute(
+                f"SELECT {RECORD_JSON} FROM json_data WHERE json_extract(data, ?) = ? ORDER BY id",
+                (f"$.{field}", value),
+            )
+            rows = cursor.fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    return cache.get(("find", field, value), query)
+
+
+# Function to save the records to a JSON file, in the {"data": [...]} format
+def export_json(file_path):
+    with open(file_path, "w") as json_file:
+        json.dump(load_data_from_db(), json_file, indent=4)
+
+
+# Function to replace the records by the ones of a JSON file in the {"data": [...]} format
+def import_json(file_path):
+    with open(file_path, "r") as json_file:
+        save_data_to_db(json.load(json_file))
 
 
 # Function to save data to the "JSON database"
 def save_data():
-    global data_store
     info = entry.get()
     if info:
-        # Load existing data from the database
-        data_store = load_data_from_db()
-
-        # Append new data to the in-memory data store
-        data_store["data"].append({"id": len(data_store["data"]) + 1, "info": info})
-
-        # Persist updated data back to the database
-        save_data_to_db(data_store)
+        # Insert one row, its id is given by the database
+        with writes.committed():
+            append_record({"info": info})
 
         entry.delete(0, tk.END)
         messagebox.showinfo("Success", "Data saved successfully!")
@@ -94,7 +118,8 @@ def main():
     # Start the application
     app.mainloop()
 
-    # Close database connection when the app is closed
+    # Commit the pending writes and close database connection when the app is closed
+    writes.close()
     conn.close()
 
 
@@ -1,11 +1,18 @@
 import json
-import sqlite3
 import tkinter as tk
 from tkinter import messagebox
 
-# Initialize the in-memory SQLite database
-conn = sqlite3.connect(":memory:")
+from sqlite_backend import GroupCommit, connect, database_path
+from store_cache import StoreCache
+
+# Initialize the SQLite database of the demo: a WAL journaled file, kept across runs (see sqlite_backend.DB_FOLDER)
+conn = connect(database_path("persist_json_to_db_visualize"))
 cursor = conn.cursor()
+# Every write goes through the group commit, the writes of a short window being committed at once
+writes = GroupCommit(conn)
+# Decoded store and query results, kept up to date by the writes of this module (see store_cache.StoreCache)
+cache = StoreCache()
+STORE_KEY = "store"
 
 # Create a table to store JSON data
 cursor.execute(
@@ -18,26 +25,34 @@ CREATE TABLE IF NOT EXISTS json_data (
 )
 conn.commit()
 
-# Initialize the JSON storage in the database (if empty)
+# Initialize the JSON storage in the database (if empty, the file may come from a previous run)
 initial_data = {"data": []}
-cursor.execute("INSERT INTO json_data (data) VALUES (?)", (json.dumps(initial_data),))
+cursor.execute("INSERT OR IGNORE INTO json_data (id, data) VALUES (1, ?)", (json.dumps(initial_data),))
 conn.commit()
 
 
-# Function to load JSON data from the database
+# Function to load JSON data from the database, decoded once then read from the cache (it must not be modified)
 def load_data_from_db():
-    cursor.execute("SELECT data FROM json_data WHERE id = 1")
-    row = cursor.fetchone()
+    return cache.get(STORE_KEY, read_data_from_db)
+
+
+def read_data_from_db():
+    with writes.read():
+        cursor.execute("SELECT data FROM json_data WHERE id = 1")
+        row = cursor.fetchone()
     if row:
         return json.loads(row[0])
     else:
         return {"data": []}
 
 
-# Function to save JSON data back to the database
+# Function to save JSON data back to the database, then to the cache (write-through)
 def save_data_to_db(data):
-    cursor.execute("UPDATE json_data SET data = ? WHERE id = 1", (json.dumps(data),))
-    conn.commit()
+    cache.write(
+        STORE_KEY,
+        lambda: writes.execute("UPDATE json_data SET data = ? WHERE id = 1", (json.dumps(data),)),
+        lambda store, _: data,
+    )
 
 
 # Function to save data to the "JSON database"
@@ -45,14 +60,15 @@ def save_data():
     global data_store
     info = entry.get()
     if info:
-        # Load existing data from the database
+        # Load existing data from the database (or the cache)
         data_store = load_data_from_db()
 
-        # Append new data to the in-memory data store
-        data_store["data"].append({"id": len(data_store["data"]) + 1, "info": info})
+        # Append new data to a new data store, the cached one is replaced once the new one is saved
+        data_store = {"data": data_store["data"] + [{"id": len(data_store["data"]) + 1, "info": info}]}
 
         # Persist updated data back to the database
-        save_data_to_db(data_store)
+        with writes.committed():
+            save_data_to_db(data_store)
 
         entry.delete(0, tk.END)
         messagebox.showinfo("Success", "Data saved successfully!")
@@ -73,11 +89,13 @@ def retrieve_data():
 # Function to view the raw JSON data stored in the database
 def view_db_data():
     # Directly query the raw JSON data from the table and print it
-    cursor.execute("SELECT * FROM json_data")
-    rows = cursor.fetchall()
+    with writes.read():
+        cursor.execute("SELECT * FROM json_data")
+        rows = cursor.fetchall()
     print("Database Content:")
     for row in rows:
         print(f"ID: {row[0]}, Data: {row[1]}")  # Print each row in the console
+    print(f"Cache: {cache.stats()}")
 
 
 # Main application setup
@@ -108,7 +126,8 @@ def main():
     # Start the application
     app.mainloop()
 
-    # Close database connection when the app is closed
+    # Commit the pending writes and close database connection when the app is closed
+    writes.close()
     conn.close()
 
 
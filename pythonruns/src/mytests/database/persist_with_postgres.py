@@ -24,12 +24,19 @@ Create a database and user:
 CREATE DATABASE testdb;
 CREATE USER testuser WITH PASSWORD 'password';
 GRANT ALL PRIVILEGES ON DATABASE testdb TO testuser;
+
+The connections come from a pool (shared by the threads of a service), the rows are inserted in batches
+(insert_rows with execute_values, copy_rows with COPY FROM STDIN) and read back by a server-side cursor (iter_rows).
 """
 
+import io
+import sys
 import tkinter as tk
+from contextlib import contextmanager
 from tkinter import messagebox
 
-import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 # Database connection settings
 DB_NAME = "testdb"
@@ -38,14 +45,56 @@ DB_PASSWORD = "password"
 DB_HOST = "localhost"
 DB_PORT = "5432"
 
+# Connections opened by the pool at start, and at most
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 10
+# Rows per INSERT statement of execute_values
+INSERT_PAGE_SIZE = 1000
+# Rows per round trip of the server-side cursor
+FETCH_SIZE = 2000
+# Characters escaped in the text format of COPY
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+pool = None
+entry = None
+
 
 def connectDB():
-    # Initialize database connection
+    # Initialize the connection pool, once: pressing the button again reuses it
+    global pool
     try:
-        conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
-        cursor = conn.cursor()
+        if pool is None:
+            pool = ThreadedConnectionPool(
+                POOL_MIN_CONNECTIONS,
+                POOL_MAX_CONNECTIONS,
+                dbname=DB_NAME,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                host=DB_HOST,
+                port=DB_PORT,
+            )
+        create_table()
+    except Exception as e:
+        print(f"Error connecting to the database: {e}")
+        sys.exit(1)
+
+
+@contextmanager
+def connection():
+    """
+    Connection of the pool for one transaction: committed at the end of the block, rolled back on an exception,
+    then given back to the pool (closed if it broke).
+    """
+    conn = pool.getconn()
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
 
-        # Create table if not exists
+def create_table():
+    with connection() as conn, conn.cursor() as cursor:
         cursor.execute(
             """
         CREATE TABLE IF NOT EXISTS data (
@@ -54,10 +103,34 @@ def connectDB():
         )
         """
         )
-        conn.commit()
-    except Exception as e:
-        print(f"Error connecting to the database: {e}")
-        exit(1)
+
+
+def insert_rows(infos, page_size=INSERT_PAGE_SIZE):
+    """
+    Inserts the rows in one transaction, page_size rows per INSERT statement (one round trip each).
+    """
+    with connection() as conn, conn.cursor() as cursor:
+        execute_values(cursor, "INSERT INTO data (info) VALUES %s", [(info,) for info in infos], page_size=page_size)
+
+
+def copy_rows(infos):
+    """
+    Inserts the rows with COPY FROM STDIN, the fastest bulk load: the rows are streamed as text, not as SQL.
+    """
+    data = io.StringIO("".join(f"{info.translate(COPY_ESCAPES)}\n" for info in infos))
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.copy_expert("COPY data (info) FROM STDIN", data)
+
+
+def iter_rows(fetch_size=FETCH_SIZE):
+    """
+    Streams the (id, info) rows from a server-side (named) cursor, fetch_size rows per round trip,
+    instead of the whole table being sent to the client at once.
+    """
+    with connection() as conn, conn.cursor(name="iter_rows") as cursor:
+        cursor.itersize = fetch_size
+        cursor.execute("SELECT id, info FROM data ORDER BY id")
+        yield from cursor
 
 
 # Function to save data
@@ -65,8 +138,7 @@ def save_data():
     info = entry.get()
     if info:
         try:
-            cursor.execute("INSERT INTO data (info) VALUES (%s)", (info,))
-            conn.commit()
+            insert_rows([info])
             entry.delete(0, tk.END)
             messagebox.showinfo("Success", "Data saved successfully!")
         except Exception as e:
@@ -78,9 +150,7 @@ def save_data():
 # Function to retrieve data
 def retrieve_data():
     try:
-        cursor.execute("SELECT * FROM data")
-        rows = cursor.fetchall()
-        result = "\n".join([f"ID: {row[0]}, Info: {row[1]}" for row in rows])
+        result = "\n".join(f"ID: {row[0]}, Info: {row[1]}" for row in iter_rows())
         if result:
             messagebox.showinfo("Retrieved Data", result)
         else:
@@ -90,6 +160,7 @@ def retrieve_data():
 
 
 def main():
+    global entry
     # Set up the main application window
     app = tk.Tk()
     app.title("PostgreSQL Database App")
@@ -114,8 +185,9 @@ def main():
     # Start the application
     app.mainloop()
 
-    # Close database connection when the app is closed
-    conn.close()
+    # Close the connections of the pool when the app is closed
+    if pool:
+        pool.closeall()
 
 
 if __name__ == "__main__":
@@ -1,13 +1,15 @@
-import sqlite3
 import tkinter as tk
 from tkinter import messagebox
 
-# Initialize database connection
-# Using ":memory:" to create an in-memory database
-conn = sqlite3.connect(":memory:")
+from sqlite_backend import GroupCommit, connect, database_path
+
+# Initialize the SQLite database of the demo: a WAL journaled file, kept across runs (see sqlite_backend.DB_FOLDER)
+conn = connect(database_path("save_to_mem_db"))
 cursor = conn.cursor()
+# Every write goes through the group commit, the writes of a short window being committed at once
+writes = GroupCommit(conn)
 
-# Create a table in the in-memory database
+# Create a table in the database
 cursor.execute(
     """
 CREATE TABLE IF NOT EXISTS data (
@@ -27,8 +29,8 @@ def save_data():
     global entry
     info = entry.get()
     if info:
-        cursor.execute("INSERT INTO data (info) VALUES (?)", (info,))
-        conn.commit()
+        with writes.committed():
+            writes.execute("INSERT INTO data (info) VALUES (?)", (info,))
         entry.delete(0, tk.END)
         messagebox.showinfo("Success", "Data saved successfully!")
     else:
@@ -37,8 +39,9 @@ def save_data():
 
 # Function to retrieve data
 def retrieve_data():
-    cursor.execute("SELECT * FROM data")
-    rows = cursor.fetchall()
+    with writes.read():
+        cursor.execute("SELECT * FROM data")
+        rows = cursor.fetchall()
     result = "\n".join([f"ID: {row[0]}, Info: {row[1]}" for row in rows])
     if result:
         messagebox.showinfo("Retrieved Data", result)
@@ -69,7 +72,8 @@ def main():
     # Start the application
     app.mainloop()
 
-    # Close database connection when the app is closed
+    # Commit the pending writes and close database connection when the app is closed
+    writes.close()
     conn.close()
 
 
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Folder of the database files of the demos, one file per demo.
+# ":memory:" keeps every database in memory only (lost on exit), e.g. MYTESTS_DB_FOLDER=:memory: for the tests.
+OUTPUT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "..", "output")
+DB_FOLDER = os.environ.get("MYTESTS_DB_FOLDER", OUTPUT_FOLDER)
+
+# Pragmas of every connection (see connect)
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+# Prepared statements kept by each connection, sqlite3 reuses them for the same SQL text
+CACHED_STATEMENTS = 256
+
+# Group commit: the writes of a window are committed at once, or as soon as this many are pending
+GROUP_COMMIT_WINDOW = 0.05
+GROUP_COMMIT_MAX_PENDING = 1000
+
+
+def database_path(name, folder=None):
+    """
+    Path of the database file of a demo, or ":memory:" when the folder is ":memory:".
+    """
+    folder = folder or DB_FOLDER
+    if folder == ":memory:":
+        return folder
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{name}.db")
+
+
+def connect(path=":memory:", mmap_size=MMAP_SIZE, cache_size_kb=CACHE_SIZE_KB):
+    """
+    SQLite connection tuned for many small writes:
+    - WAL journal: a commit appends to the log instead of rewriting pages through a rollback journal,
+      and readers are not blocked by the writer
+    - synchronous=NORMAL: in WAL mode the log is synced at checkpoints only, a commit stays atomic and
+      survives a crash of the application (the last ones may be lost on a power failure)
+    - mmap_size and cache_size: reads straight from the mapped file, and a larger page cache
+    The connection can be used from other threads (see GroupCommit).
+    """
+    conn = sqlite3.connect(path, cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+    if path != ":memory:":
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+    conn.execute(f"PRAGMA cache_size={-int(cache_size_kb)}")
+    return conn
+
+
+class GroupCommit:
+    """
+    Batches the writes of a connection: they share one transaction, committed once per time window
+    (by a timer thread) or as soon as max_pending writes are waiting, instead of one commit per write.
+    A write is durable once committed: at most `window` seconds later, or at the end of a committed block
+    for the writes reported as saved. A window of 0 commits every write on its own.
+    Every write of the connection must go through it (execute or transaction), so the timer never commits
+    half of another transaction, and every read too (read), so it never runs while the timer thread commits.
+    """
+
+    def __init__(self, conn, window=GROUP_COMMIT_WINDOW, max_pending=GROUP_COMMIT_MAX_PENDING):
+        self.conn = conn
+        self.window = window
+        self.max_pending = max_pending
+        self.pending = 0
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def execute(self, sql, parameters=()):
+        """
+        Runs a write in the current transaction.
+        :return: The cursor of the statement, e.g. for its lastrowid
+        """
+        with self.lock:
+            cursor = self.conn.execute(sql, parameters)
+            self.pending += 1
+            if self.pending >= self.max_pending or not self.window:
+                self.commit()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+            return cursor
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs a block of writes as one transaction of its own, after committing the pending writes
+        (committed at the end of the block, rolled back on an exception, like `with conn:`).
+        """
+        with self.lock:
+            self.commit()
+            with self.conn:
+                yield self.conn
+
+    @contextmanager
+    def committed(self):
+        """
+        Runs a block of writes committed before it ends, with the pending ones, e.g. before reporting them saved
+        to the user: the other writes are left to the window.
+        """
+        yield
+        self.flush()
+
+    @contextmanager
+    def read(self):
+        """
+        Runs a block of reads of the connection, which the timer thread does not commit in the middle of.
+        """
+        with self.lock:
+            yield self.conn
+
+    def flush(self):
+        """
+        Commits the pending writes now.
+        """
+        with self.lock:
+            self.commit()
+
+    def commit(self):
+        # Called with the lock held
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        self.flush()
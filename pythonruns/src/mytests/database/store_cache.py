@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict
+
+# Decoded values kept at most, the least recently used being evicted first
+CACHE_SIZE = 128
+# Seconds a value is trusted before it is loaded again: the database is a file other processes may write
+CACHE_TTL = 60
+
+
+class StoreCache:
+    """
+    LRU/TTL cache of values decoded from the database (the JSON store, query results), keyed by name:
+    - reads through: get loads a value on a miss, and keeps it until it is evicted, expires or is invalidated
+    - writes through: write saves to the database first, then brings the cached value up to date in place
+    - dirty keys: the ones being written, not yet saved
+    Cached values are shared with the callers, who must not modify them.
+    Not thread-safe: it is used by the thread of the application only (the GroupCommit timer thread only commits).
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # key: (value, load time), most recently used last
+        self.dirty = set()
+        self.hits = self.misses = self.evictions = self.expirations = self.writes = 0
+
+    def get(self, key, load):
+        """
+        Cached value of a key, or load() on a miss (a dirty or expired entry being a miss).
+        """
+        entry = self.entries.get(key)
+        if entry and key not in self.dirty:
+            value, loaded = entry
+            if self.ttl is None or self.clock() - loaded < self.ttl:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return value
+            self.expirations += 1
+        self.misses += 1
+        value = load()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = (value, self.clock())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def write(self, key, save, update=None):
+        """
+        Write-through: runs save() (the database write), then replaces the cached value of the key, if any,
+        by update(value, result of save). Without update, or when save fails, the entry is dropped instead.
+        :return: The result of save
+        """
+        self.dirty.add(key)
+        try:
+            result = save()
+            entry = self.entries.get(key)
+            if entry and update:
+                self.entries[key] = (update(entry[0], result), entry[1])
+            else:
+                self.entries.pop(key, None)
+            self.writes += 1
+            return result
+        except BaseException:
+            self.entries.pop(key, None)
+            raise
+        finally:
+            self.dirty.discard(key)
+
+    def invalidate(self, *keys):
+        """
+        Drops the given keys, or every entry without keys (e.g. when the database contents are replaced).
+        """
+        if not keys:
+            self.entries.clear()
+        for key in keys:
+            self.entries.pop(key, None)
+
+    def invalidate_if(self, predicate):
+        for key in [key for key in self.entries if predicate(key)]:
+            del self.entries[key]
+
+    def stats(self):
+        """
+        Hit/miss metrics of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "writes": self.writes,
+            "size": len(self.entries),
+            "dirty": len(self.dirty),
+        }
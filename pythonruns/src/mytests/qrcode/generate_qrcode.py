@@ -1,13 +1,51 @@
+import csv
+import io
+import json
+import math
+import os
+import re
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import chain, islice
+
+import numpy as np
 import qrcode
+from PIL import Image
+
+# Bulk generation settings
+BOX_SIZE = 10
+BORDER = 4
+SHEET_COLUMNS = 6
+SHEET_ROWS = 8
+# Payloads rendered by one task of the pool in the "png" mode (sheets and PDF pages are one task each)
+PNG_BATCH_SIZE = 256
+MATRIX_CACHE_SIZE = 4096
+OUTPUT_MODES = ("png", "svg", "sheet", "pdf", "vector_pdf")
+# Output modes writing one file per payload, the others write pages of columns x rows codes
+FILE_MODES = ("png", "svg")
+PDF_DPI = 300
 
 
-def generate_qr_code():
+def generate_qr_code(data="http://wtechitsolutions.com/", file_path="../output/MyQRCode.png", show=True):
     """
     Generate a QR code and save it as an image.
+    :param data: url or text to encode in the QR code
+    :param file_path: path to save the generated QR code image
+    :param show: open the image in the default image viewer
     :return:
     """
     print("####### Create a QR-Code with python #######")
 
+    if file_path.lower().endswith((".svg", ".pdf")):
+        # Vector output: same code (border of 5 modules, 10 pixels or points per module), no raster image
+        matrix = qr_matrix(data, border=5)
+        save_vector(matrix, file_path, matrix.shape[0] * 10)
+        print(f"QR code generated and saved to {file_path}")
+        return
+
     # qr = _qrcode.QRCode(
     #     version=1,
     #     error_correction=_qrcode.constants.ERROR_CORRECT_L,
@@ -15,9 +53,6 @@ def generate_qr_code():
     #     border=4
     # )
 
-    # Data to encode
-    data = "http://wtechitsolutions.com/"
-
     # Creating an instance of QRCode class
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
 
@@ -28,12 +63,432 @@ def generate_qr_code():
     img = qr.make_image(fill_color="black", back_color="white")
 
     # Save the image
-    file_path = "../output/MyQRCode.png"
     img.save(file_path)
 
     print(f"QR code generated and saved to {file_path}")
-    img.show()  # This will open the image using the default image viewer
+    if show:
+        img.show()  # This will open the image using the default image viewer
+
+
+def generate_bulk(
+    payloads_path,
+    output,
+    mode="png",
+    workers=None,
+    box_size=BOX_SIZE,
+    columns=SHEET_COLUMNS,
+    rows=SHEET_ROWS,
+    error_correction=qrcode.constants.ERROR_CORRECT_M,
+    mask_pattern=None,
+):
+    """
+    Generates a QR code for every payload of a CSV or JSON Lines file (see read_payloads), in a process pool.
+    The payloads are streamed: only a few batches per worker are read ahead, whatever the size of the file.
+    :param payloads_path: CSV or JSON Lines file of payloads
+    :param output: Output folder for "png", "svg" and "sheet", PDF file path for "pdf" and "vector_pdf"
+    :param mode: "png" or "svg" for one file per payload (see unique_names), "sheet" for PNG sprite sheets of
+                 columns x rows codes, "pdf" for one multi-page PDF with a sheet per page, "vector_pdf" for the
+                 same with the codes drawn as paths (sharp at any print size, the file size does not grow with
+                 box_size). Sheets and PDF come with an index CSV telling where each payload is.
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :param box_size: Pixels per QR module (at PDF_DPI for the PDF pages)
+    :param error_correction: qrcode.constants.ERROR_CORRECT_*
+    :param mask_pattern: Optional fixed mask pattern (0-7), about 7 times faster to encode than letting
+                         qrcode try the 8 of them, the codes stay valid but may be a little harder to scan
+    :return: Number of codes generated
+    """
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode [{mode}], expected one of {OUTPUT_MODES}")
+    workers = workers or os.cpu_count()
+    payloads = read_payloads(payloads_path)
+    if mode in FILE_MODES:
+        payloads = unique_names(payloads)
+    batch_size = PNG_BATCH_SIZE if mode in FILE_MODES else columns * rows
+    batches = iter(lambda: list(islice(payloads, batch_size)), [])
+    print(f"####### Generating QR codes of [{payloads_path}] as [{mode}] with {workers} workers #######")
+
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if mode in FILE_MODES:
+            os.makedirs(output, exist_ok=True)
+            tasks = bounded_map(
+                executor, 2 * workers, write_codes, batches, output, box_size, error_correction, mask_pattern, mode
+            )
+            for count in tasks:
+                total += count
+                print(f"----> [{total}] QR codes saved to [{output}]")
+            return total
+
+        image_format = {"sheet": "PNG", "pdf": "PDF", "vector_pdf": "VECTOR_PDF"}[mode]
+        pages = bounded_map(
+            executor, 2 * workers, render_page, batches, columns, box_size, error_correction, mask_pattern, image_format
+        )
+        if mode == "sheet":
+            os.makedirs(output, exist_ok=True)
+            index_path = os.path.join(output, "index.csv")
+        else:
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+            index_path = os.path.splitext(output)[0] + "_index.csv"
+        with (
+            open(index_path, "w", newline="", encoding="utf-8") as index_file,
+            PdfWriter(output) if mode != "sheet" else nullcontext() as pdf,
+        ):
+            index = csv.writer(index_file)
+            index.writerow(["name", "page", "row", "column"])
+            for page, (names, data) in enumerate(pages, 1):
+                if mode == "pdf":
+                    pdf.add_image_page(*data)
+                elif mode == "vector_pdf":
+                    pdf.add_vector_page(*data)
+                else:
+                    with open(os.path.join(output, f"sheet_{page}.png"), "wb") as f:
+                        f.write(data)
+                index.writerows((name, page, i // columns + 1, i % columns + 1) for i, name in enumerate(names))
+                total += len(names)
+                print(f"----> Page [{page}] - [{total}] QR codes")
+    print(f"QR codes generated and saved to {output}")
+    return total
+
+
+def read_payloads(path):
+    """
+    Streams the payloads of a CSV or JSON Lines (.jsonl/.ndjson) file as (name, data) pairs.
+    CSV: the "data" column and the optional "name" column of the header, or the first column without header.
+    JSON Lines: objects with a "data" and an optional "name" key, or plain strings.
+    Payloads without a name are named after their number in the file.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            records = (json.loads(line) for line in f if line.strip())
+            for number, record in enumerate(records, 1):
+                if isinstance(record, dict):
+                    yield str(record.get("name", number)), str(record["data"])
+                else:
+                    yield str(number), str(record)
+            return
+
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        if "data" in header:
+            data_index = header.index("data")
+            name_index = header.index("name") if "name" in header else None
+            rows = reader
+        else:
+            data_index, name_index = 0, None
+            rows = chain([header], reader)
+        for number, row in enumerate((row for row in rows if row), 1):
+            yield (row[name_index] if name_index is not None else str(number)), row[data_index]
+
+
+@lru_cache(maxsize=MATRIX_CACHE_SIZE)
+def qr_matrix(data, error_correction=qrcode.constants.ERROR_CORRECT_M, border=BORDER, mask_pattern=None):
+    """
+    Module matrix of the QR code of a payload, border included, True for the dark modules.
+    Cached, so repeated payloads are encoded once per process (the matrix is read-only).
+    """
+    qr = qrcode.QRCode(error_correction=error_correction, border=border, mask_pattern=mask_pattern)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = np.array(qr.get_matrix(), dtype=bool)
+    matrix.flags.writeable = False
+    return matrix
+
+
+def rasterize_qr(matrix, box_size=BOX_SIZE, size=None):
+    """
+    Pixels of a module matrix as a boolean array (True for dark), each module being box_size x box_size pixels,
+    repeated along both axes in numpy (no drawing box by box, no resampling).
+    :param size: Optional side in pixels: the box size is then the largest whole one fitting, and the code is
+                 centered in a light square of that size
+    """
+    modules = matrix.shape[0]
+    if size:
+        if size < modules:
+            raise ValueError(f"A QR code of {modules} modules needs at least {modules} pixels, got {size}")
+        box_size = size // modules
+    code = np.repeat(np.repeat(matrix, box_size, axis=0), box_size, axis=1)
+    if not size or size == code.shape[0]:
+        return code
+    pixels = np.zeros((size, size), dtype=bool)
+    start = (size - code.shape[0]) // 2
+    pixels[start : start + code.shape[0], start : start + code.shape[0]] = code
+    return pixels
+
+
+def render_qr(matrix, box_size=BOX_SIZE):
+    """
+    1-bit image of a module matrix, each module being box_size x box_size pixels.
+    """
+    return Image.fromarray(~rasterize_qr(matrix, box_size))
+
+
+def dark_runs(matrix):
+    """
+    Horizontal runs of adjacent dark modules, found with numpy: the rising and falling edges of each row.
+    :return: Arrays of the row, first column and length of every run
+    """
+    edges = np.diff(np.pad(matrix, ((0, 0), (1, 1))).view(np.int8), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return rows, starts, ends - starts
+
+
+def hole_square(modules, hole_ratio):
+    """
+    Side and offset of a centered square hole, in modules.
+    """
+    side = modules * hole_ratio
+    return side, (modules - side) / 2
+
+
+def qr_svg(matrix, size=None, hole_ratio=None):
+    """
+    SVG of a module matrix: one path stroking each run of dark modules (see dark_runs) with a line one module
+    thick, in module units so it scales to any size. An optional centered hole is cut out with a clip region.
+    :param size: Optional width and height of the SVG, in pixels
+    :param hole_ratio: Optional side of the transparent hole, as a ratio of the code side
+    """
+    modules = matrix.shape[0]
+    rows, columns, lengths = dark_runs(matrix)
+    path = "".join(f"M{c} {r}.5h{n}" for r, c, n in zip(rows.tolist(), columns.tolist(), lengths.tolist()))
+    defs = clip = ""
+    if hole_ratio:
+        side, start = hole_square(modules, hole_ratio)
+        # Even-odd: the whole code minus the hole square
+        defs = (
+            f'<defs><clipPath id="hole"><path clip-rule="evenodd" '
+            f'd="M0 0h{modules}v{modules}h-{modules}zM{start:g} {start:g}h{side:g}v{side:g}h-{side:g}z"/>'
+            f"</clipPath></defs>"
+        )
+        clip = ' clip-path="url(#hole)"'
+    dimensions = f' width="{size}" height="{size}"' if size else ""
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {modules} {modules}"{dimensions} '
+        f'shape-rendering="crispEdges">{defs}<g{clip}><rect width="{modules}" height="{modules}" fill="#fff"/>'
+        f'<path d="{path}" stroke="#000"/></g></svg>'
+    )
+
+
+def qr_pdf_content(matrix, x=0, y=0, module_size=1, hole_ratio=None):
+    """
+    PDF drawing operators of a module matrix, its top left corner at (x, y) from the bottom left of the page:
+    a rectangle per run of dark modules, filled at once. An optional centered hole is left out with an even-odd clip.
+    """
+    modules = matrix.shape[0]
+    # Module units with the rows going down, like the matrix
+    operators = [b"q %g 0 0 %g %g %g cm" % (module_size, -module_size, x, y)]
+    if hole_ratio:
+        side, start = hole_square(modules, hole_ratio)
+        operators.append(b"0 0 %d %d re %g %g %g %g re W* n" % (modules, modules, start, start, side, side))
+    operators.append(b"1 g 0 0 %d %d re f 0 g" % (modules, modules))
+    rows, columns, lengths = dark_runs(matrix)
+    operators.extend(b"%d %d %d 1 re" % run for run in zip(columns.tolist(), rows.tolist(), lengths.tolist()))
+    operators.append(b"f Q")
+    return b"\n".join(operators)
+
+
+def save_vector(matrix, file_path, size, hole_ratio=None):
+    """
+    Saves a module matrix as an SVG (size in pixels) or a one page PDF (size in points), by the file extension.
+    """
+    if file_path.lower().endswith(".pdf"):
+        with PdfWriter(file_path) as pdf:
+            pdf.add_vector_page(size, size, qr_pdf_content(matrix, 0, size, size / matrix.shape[0], hole_ratio))
+    else:
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(qr_svg(matrix, size, hole_ratio))
+
+
+def render_sheet(matrices, columns=SHEET_COLUMNS, box_size=BOX_SIZE):
+    """
+    1-bit sprite sheet of QR codes, in rows of `columns` cells sized for the largest code.
+    """
+    cell = max(matrix.shape[0] for matrix in matrices) * box_size
+    sheet = Image.new("1", (columns * cell, math.ceil(len(matrices) / columns) * cell), 1)
+    for i, matrix in enumerate(matrices):
+        img = render_qr(matrix, box_size)
+        offset = (cell - img.width) // 2
+        sheet.paste(img, ((i % columns) * cell + offset, (i // columns) * cell + offset))
+    return sheet
+
+
+def vector_sheet(matrices, columns=SHEET_COLUMNS, module_size=BOX_SIZE * 72 / PDF_DPI):
+    """
+    PDF page of QR codes drawn as paths, laid out like render_sheet.
+    :param module_size: Side of a module in points
+    :return: Width and height of the page in points, and its drawing operators
+    """
+    cell = max(matrix.shape[0] for matrix in matrices) * module_size
+    width, height = columns * cell, math.ceil(len(matrices) / columns) * cell
+    content = []
+    for i, matrix in enumerate(matrices):
+        offset = (cell - matrix.shape[0] * module_size) / 2
+        x = (i % columns) * cell + offset
+        y = height - (i // columns) * cell - offset
+        content.append(qr_pdf_content(matrix, x, y, module_size))
+    return width, height, b"\n".join(content)
+
+
+def write_codes(
+    batch,
+    output_folder,
+    box_size=BOX_SIZE,
+    error_correction=qrcode.constants.ERROR_CORRECT_M,
+    mask_pattern=None,
+    file_format="png",
+):
+    """
+    Task of the pool: saves the QR code of each (file name, data) payload as <file name>.png or <file name>.svg.
+    :param batch: Payloads named by unique_names
+    :return: Number of files written
+    """
+    for name, data in batch:
+        matrix = qr_matrix(data, error_correction, mask_pattern=mask_pattern)
+        file_path = os.path.join(output_folder, f"{name}.{file_format}")
+        if file_format == "svg":
+            save_vector(matrix, file_path, matrix.shape[0] * box_size)
+        else:
+            render_qr(matrix, box_size).save(file_path, optimize=True)
+    return len(batch)
+
+
+def render_page(
+    batch,
+    columns=SHEET_COLUMNS,
+    box_size=BOX_SIZE,
+    error_correction=qrcode.constants.ERROR_CORRECT_M,
+    mask_pattern=None,
+    image_format="PNG",
+):
+    """
+    Task of the pool: renders the QR codes of (name, data) payloads as one sheet.
+    :return: Names of the payloads and the sheet: PNG bytes, or the arguments of PdfWriter.add_image_page
+             (image_format "PDF") or PdfWriter.add_vector_page (image_format "VECTOR_PDF")
+    """
+    matrices = [qr_matrix(data, error_correction, mask_pattern=mask_pattern) for _, data in batch]
+    names = [name for name, _ in batch]
+    if image_format == "VECTOR_PDF":
+        return names, vector_sheet(matrices, columns, box_size * 72 / PDF_DPI)
+    sheet = render_sheet(matrices, columns, box_size)
+    if image_format == "PDF":
+        return names, (sheet.width, sheet.height, zlib.compress(sheet.tobytes()))
+    buffer = io.BytesIO()
+    sheet.save(buffer, format="PNG", optimize=True)
+    return names, buffer.getvalue()
+
+
+def bounded_map(executor, max_pending, function, items, *args):
+    """
+    Like executor.map, but new tasks are submitted only as results are consumed,
+    so a huge stream of items is never read and queued all at once.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(function, item, *args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def safe_name(name):
+    return re.sub(r"[^\w.-]", "_", name) or "_"
+
+
+def unique_names(payloads):
+    """
+    Names each (name, data) payload after a file name of its own: the safe_name of its name, followed by its
+    number in the file when an earlier payload already has it (a repeated name, or one differing by the
+    characters safe_name replaces only, like "a/b" and "a_b").
+    """
+    used = set()
+    for number, (name, data) in enumerate(payloads, 1):
+        file_name = safe_name(name)
+        while file_name in used:
+            file_name = f"{file_name}_{number}"
+        used.add(file_name)
+        yield file_name, data
+
+
+class PdfWriter:
+    """
+    Minimal PDF writer adding the pages one at a time straight to the file, so a document of thousands of pages
+    never sits in memory (Pillow's save_all needs every page loaded at once).
+    Used as a context manager, the file is opened on entering and completed and closed on exit:
+    with PdfWriter(path) as pdf: pdf.add_vector_page(...)
+    """
+
+    def __init__(self, path, dpi=PDF_DPI):
+        self.path = path
+        self.file = None
+        self.dpi = dpi
+        self.page_numbers = []
+        # Objects 1 and 2 (catalog and page tree) are written by close, once all the pages are known
+        self.offsets = [0, 0]
+
+    def __enter__(self):
+        self.file = open(self.path, "wb")
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_object(self, body):
+        self.offsets.append(self.file.tell())
+        number = len(self.offsets)
+        self.file.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        return number
+
+    def add_stream(self, dictionary, data):
+        return self.add_object(b"<< %s /Length %d >>\nstream\n%s\nendstream" % (dictionary, len(data), data))
+
+    def add_image_page(self, width, height, data):
+        """
+        Adds a page showing a 1-bit image at the writer's dpi.
+        :param data: Rows of the image packed 8 pixels per byte (1 is white), zlib compressed
+        """
+        image = self.add_stream(
+            b"/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray /BitsPerComponent 1 "
+            b"/Filter /FlateDecode" % (width, height),
+            data,
+        )
+        page_width, page_height = width * 72 / self.dpi, height * 72 / self.dpi
+        content = self.add_stream(b"", b"q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q" % (page_width, page_height))
+        self.add_page(page_width, page_height, b"/XObject << /Im0 %d 0 R >>" % image, content)
+
+    def add_vector_page(self, width, height, content):
+        """
+        Adds a page of width x height points drawn by PDF operators (see qr_pdf_content).
+        """
+        content = self.add_stream(b"/Filter /FlateDecode", zlib.compress(content))
+        self.add_page(width, height, b"", content)
+
+    def add_page(self, width, height, resources, content):
+        self.page_numbers.append(
+            self.add_object(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Resources << %s >> /Contents %d 0 R >>"
+                % (width, height, resources, content)
+            )
+        )
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % number for number in self.page_numbers)
+        self.offsets[0] = self.file.tell()
+        self.file.write(b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+        self.offsets[1] = self.file.tell()
+        self.file.write(b"2 0 obj\n<< /Type /Pages /Kids [%s] /Count %d >>\nendobj\n" % (kids, len(self.page_numbers)))
+        xref = self.file.tell()
+        self.file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.offsets) + 1))
+        self.file.writelines(b"%010d 00000 n \n" % offset for offset in self.offsets)
+        self.file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\n" % (len(self.offsets) + 1))
+        self.file.write(b"startxref\n%d\n%%%%EOF\n" % xref)
+        self.file.close()
 
 
 if __name__ == "__main__":
     generate_qr_code()
+    # Bulk generation, e.g. of ticket codes:
+    # generate_bulk("../resources/tickets.csv", "../output/tickets.pdf", mode="pdf")
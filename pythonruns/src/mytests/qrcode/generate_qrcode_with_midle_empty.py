@@ -1,40 +1,59 @@
+import os
+from functools import lru_cache
+
+import cv2
+import numpy as np
 import qrcode
-from PIL import Image, ImageDraw
+from generate_qrcode import (
+    qr_matrix,
+    rasterize_qr,
+    read_payloads,
+    save_vector,
+    unique_names,
+)
+from PIL import Image, ImageOps
+
+# Scaled logos kept by load_logo, one per (logo, size) pair
+LOGO_CACHE_SIZE = 16
+# Hole width as a ratio of the code width: 4% of the modules, well within what ERROR_CORRECT_H recovers (30%),
+# with room for the damage a logo overflowing it does around
+HOLE_SIZE_RATIO = 0.2
+# Save paths written as vector paths, a raster logo can not go into them
+VECTOR_EXTENSIONS = (".svg", ".pdf")
 
 
-def generate_qr_with_hole(data: str, hole_size_ratio=0.25, qr_size=400, save_path="../output/qr_with_hole.png") -> None:
+def generate_qr_with_hole(
+    data: str, hole_size_ratio=HOLE_SIZE_RATIO, qr_size=400, save_path="../output/qr_with_hole.png", logo_path=None
+) -> None:
     """
     Generate a QR code with a transparent hole in the center for adding a logo.
     :param data: url or text to encode in the QR code
     :param hole_size_ratio: the size of the hole as a ratio of the QR code size
     :param qr_size: the size of the QR code in pixels
-    :param save_path: path to save the generated QR code image
+    :param save_path: path to save the generated QR code image, an .svg or .pdf path saves it as vector paths
+    :param logo_path: optional logo composited into the hole, the code must still decode with it
+        (raster save paths only)
     :return: None
     """
-    # Generate QR code
-    qr = qrcode.QRCode(
-        error_correction=qrcode.constants.ERROR_CORRECT_H  # High error correction to tolerate logo overlay
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    img_qr = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-
-    # Resize QR to desired size
-    img_qr = img_qr.resize((qr_size, qr_size), Image.LANCZOS)
-
-    # Create a mask with a transparent hole in the center
-    mask = Image.new("L", (qr_size, qr_size), 255)  # Fully opaque
-    draw = ImageDraw.Draw(mask)
+    vector = save_path.lower().endswith(VECTOR_EXTENSIONS)
+    if logo_path and vector:
+        raise ValueError(f"A logo can only be saved in a raster image, not in [{save_path}]")
+    if logo_path:
+        img_with_logo = qr_with_logo(data, logo_path, hole_size_ratio, qr_size)
+        if not decodes(img_with_logo, data):
+            raise ValueError(f"The QR code of [{data}] does not decode with the logo, try a smaller hole_size_ratio")
+        img_with_logo.save(save_path)
+        print(f"QR code generated and saved to {save_path}")
+        img_with_logo.show()
+        return
 
-    hole_size = int(qr_size * hole_size_ratio)
-    top_left = ((qr_size - hole_size) // 2, (qr_size - hole_size) // 2)
-    bottom_right = (top_left[0] + hole_size, top_left[1] + hole_size)
-
-    draw.rectangle([top_left, bottom_right], fill=0)  # Transparent hole
+    if vector:
+        # The hole is clipped out of the paths, nothing is rasterized
+        save_vector(qr_matrix(data, qrcode.constants.ERROR_CORRECT_H), save_path, qr_size, hole_size_ratio)
+        print(f"QR code generated and saved to {save_path}")
+        return
 
-    # Apply the mask to make the center transparent
-    img_with_hole = img_qr.copy()
-    img_with_hole.putalpha(mask)
+    img_with_hole = qr_with_hole(data, hole_size_ratio, qr_size)
 
     # Save the result
     img_with_hole.save(save_path)
@@ -43,8 +62,81 @@ def generate_qr_with_hole(data: str, hole_size_ratio=0.25, qr_size=400, save_pat
     img_with_hole.show()  # This will open the image using the default image viewer
 
 
+def qr_with_hole(data: str, hole_size_ratio=HOLE_SIZE_RATIO, qr_size=400) -> Image.Image:
+    """
+    RGBA image of a QR code with a transparent square hole in the center, built straight from the module matrix:
+    whole pixels per module (no resampling blur), the hole being a slice of the alpha channel.
+    """
+    # High error correction to tolerate logo overlay
+    pixels = rasterize_qr(qr_matrix(data, qrcode.constants.ERROR_CORRECT_H), size=qr_size)
+
+    gray = np.logical_not(pixels).view(np.uint8) * np.uint8(255)
+    rgba = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGBA)  # Fully opaque
+
+    hole_size = int(qr_size * hole_size_ratio)
+    start = (qr_size - hole_size) // 2
+    rgba[start : start + hole_size, start : start + hole_size, 3] = 0  # Transparent hole
+    return Image.fromarray(rgba, "RGBA")
+
+
+def generate_batch_with_logo(
+    payloads_path, output_folder, logo_path, hole_size_ratio=HOLE_SIZE_RATIO, qr_size=400, verify=True
+) -> list:
+    """
+    Generates a QR code with the logo in its hole for every payload of a CSV or JSON Lines file
+    (see generate_qrcode.read_payloads), saved as <file name>.png (see generate_qrcode.unique_names).
+    The logo is loaded and scaled once for the whole batch.
+    :param verify: Decode every code back with OpenCV, the ones not decoding are reported and not saved
+    :return: File names of the payloads whose code did not decode with the logo
+    """
+    print(f"####### Generating QR codes of [{payloads_path}] with the logo [{logo_path}] #######")
+    os.makedirs(output_folder, exist_ok=True)
+    failed = []
+    for count, (name, data) in enumerate(unique_names(read_payloads(payloads_path)), 1):
+        img = qr_with_logo(data, logo_path, hole_size_ratio, qr_size)
+        if verify and not decodes(img, data):
+            print(f"----> [{name}] does not decode with the logo, skipped")
+            failed.append(name)
+            continue
+        img.save(os.path.join(output_folder, f"{name}.png"))
+        if count % 100 == 0:
+            print(f"----> [{count}] QR codes")
+    print(f"QR codes generated and saved to {output_folder} - [{len(failed)}] not decoding")
+    return failed
+
+
+def qr_with_logo(data: str, logo_path, hole_size_ratio=HOLE_SIZE_RATIO, qr_size=400) -> Image.Image:
+    """
+    RGBA image of a QR code (see qr_with_hole) with the logo alpha-composited, centered, into its hole.
+    """
+    img = qr_with_hole(data, hole_size_ratio, qr_size)
+    logo = load_logo(logo_path, int(qr_size * hole_size_ratio))
+    img.alpha_composite(logo, ((img.width - logo.width) // 2, (img.height - logo.height) // 2))
+    return img
+
+
+@lru_cache(maxsize=LOGO_CACHE_SIZE)
+def load_logo(logo_path, size) -> Image.Image:
+    """
+    Logo as RGBA, scaled up or down to fit a size x size square (aspect ratio kept).
+    Cached, so a batch reads and resamples it once: composite it, never modify it.
+    """
+    with Image.open(logo_path) as logo:
+        return ImageOps.contain(logo.convert("RGBA"), (size, size), Image.LANCZOS)
+
+
+def decodes(img: Image.Image, data: str) -> bool:
+    """
+    Round-trip check: whether OpenCV's QR detector reads data back from the image, flattened on white
+    (the transparent hole would otherwise show the modules under it).
+    """
+    flat = Image.alpha_composite(Image.new("RGBA", img.size, "white"), img.convert("RGBA")).convert("L")
+    decoded, _, _ = cv2.QRCodeDetector().detectAndDecode(np.asarray(flat))
+    return decoded == data
+
+
 # Example usage
-# generate_qr_with_hole("https://example.com", hole_size_ratio=0.25)
+# generate_qr_with_hole("https://example.com", hole_size_ratio=0.2)
 
 if __name__ == "__main__":
-    generate_qr_with_hole("https://www.skipy.online/", hole_size_ratio=0.25)
+    generate_qr_with_hole("https://www.skipy.online/")
@@ -1,43 +1,351 @@
 import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
 
 import cv2
+import numpy as np
 from PIL import Image, ImageFile
-from rembg import remove
+from rembg import new_session, remove
+from resize_images import find_images
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
+DEFAULT_MODEL = "u2net"
+# Images decoded ahead of the model, and cutouts waiting to be encoded
+PIPELINE_QUEUE_SIZE = 4
+# Fast guided filter refining the upscaled masks (radius in pixels of the downscaled copy, eps on 0-1 values)
+GUIDED_RADIUS = 4
+GUIDED_EPS = 1e-3
+# Marks the end of a stage's output
+_DONE = object()
+# Model of each worker process of remove_background_folder, loaded once by init_worker
+_worker_remover = None
 
-def remove_bg_pil_image(input_path: str, output_path: str):
+
+@cache
+def default_session(model_name=DEFAULT_MODEL):
+    """
+    Model session shared by the functions below, rembg.remove() would load the model again on every call.
+    """
+    return new_session(model_name)
+
+
+def remove_bg_pil_image(input_path: str, output_path: str, session=None):
     print(">> Input and output as a PIL image")
     img = Image.open(input_path)
-    output = remove(img)
+    output = remove(img, session=session or default_session())
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     output.save(output_path)
     print(f"✅ Saved to: {output_path}")
 
 
-def remove_bg_bytes(input_path: str, output_path: str):
+def remove_bg_bytes(input_path: str, output_path: str, session=None):
     print(">> Input and output as bytes")
     with open(input_path, "rb") as i:
         input_bytes = i.read()
-        output_bytes = remove(input_bytes)
+        output_bytes = remove(input_bytes, session=session or default_session())
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     with open(output_path, "wb") as o:
         o.write(output_bytes)
     print(f"✅ Saved to: {output_path}")
 
 
-def remove_bg_numpy(input_path: str, output_path: str):
+def remove_bg_numpy(input_path: str, output_path: str, session=None):
     print(">> Input and output as a numpy array")
     img = cv2.imread(input_path)
     if img is None:
         raise FileNotFoundError(f"Could not read image from {input_path}")
-    output = remove(img)
+    output = remove(img, session=session or default_session())
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     cv2.imwrite(output_path, output)
     print(f"✅ Saved to: {output_path}")
 
 
+class BackgroundRemover:
+    """
+    Removes the background of many images with one rembg model session, loaded once.
+    The images go through a pipeline: a thread decodes the next images and another one runs the model,
+    while the caller encodes the previous cutouts. The stages are linked by bounded queues, so memory stays
+    flat whatever the number of images (ONNX Runtime and Pillow release the GIL while they work).
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, queue_size=PIPELINE_QUEUE_SIZE, mask_max_side=None, **session_options):
+        """
+        :param model_name: rembg model, e.g. "u2net", "u2netp", "isnet-general-use"
+        :param queue_size: Max images waiting between two stages
+        :param mask_max_side: Optional fast mode, larger images get their mask from a copy downscaled to it
+        :param session_options: Passed to rembg.new_session, e.g. providers=["CPUExecutionProvider"]
+        """
+        print(f">> Loading model [{model_name}]")
+        self.session = new_session(model_name, **session_options)
+        self.queue_size = queue_size
+        self.mask_max_side = mask_max_side
+
+    def remove(self, image):
+        """
+        Removes the background of one image: PIL image, numpy array or bytes, returned in the same type.
+        With mask_max_side, larger PIL images and arrays go through remove_downscaled.
+        """
+        if self.mask_max_side and not isinstance(image, bytes) and max(image_size(image)) > self.mask_max_side:
+            return self.remove_downscaled(image)
+        return remove(image, session=self.session)
+
+    def remove_downscaled(self, image):
+        """
+        Fast mode for large images: the model runs on a copy downscaled to mask_max_side, the mask is brought back
+        to full resolution with edges following the original (see upscale_mask) and set as its alpha channel.
+        rembg itself resizes the full image to the model input and the mask back with LANCZOS, then composites
+        with PIL, which dominates the time on large photos.
+        Unlike rembg the color channels are kept as they are (not multiplied by the mask).
+        :param image: PIL image or numpy array (its channels order is kept like rembg does, 2-D gray ones get 3)
+        :return: RGBA PIL image, or numpy array with the alpha added
+        """
+        is_array = isinstance(image, np.ndarray)
+        if is_array and image.ndim == 2:
+            pixels = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+        elif is_array:
+            pixels = image[..., :3]
+        else:
+            pixels = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+        small = downscale_pixels(pixels, self.mask_max_side)
+        mask = self.session.predict(Image.fromarray(small))[0]
+        # Adding the alpha channel in one pass, a lot faster than stacking the arrays
+        cutout = cv2.cvtColor(pixels, cv2.COLOR_RGB2RGBA)
+        cutout[..., 3] = upscale_mask(np.asarray(mask), gray(small), gray(pixels))
+        return cutout if is_array else Image.fromarray(cutout, "RGBA")
+
+    def iter_remove(self, images):
+        """
+        Removes the background of images lazily, in the order received.
+        :param images: Iterable of image paths, PIL images or numpy arrays (OpenCV BGR, like remove_bg_numpy)
+        :return: Generator of (image, cutout) pairs, the cutout being RGBA (PIL) or BGRA (numpy)
+        """
+        decoded = prefetch(load_image, images, self.queue_size)
+        yield from prefetch(lambda pair: (pair[0], self.remove(pair[1])), decoded, self.queue_size)
+
+    def remove_all(self, images, output_folder):
+        """
+        Removes the background of images and saves the cutouts as PNG files in output_folder,
+        named after the input files (image_<n>.png for images given in memory), see output_name.
+        Two files of the same name in different folders raise a ValueError, before the second cutout is saved.
+        :return: Paths of the saved files
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        output_paths, saved = [], set()
+        for number, (image, cutout) in enumerate(self.iter_remove(images), 1):
+            output_path = os.path.join(output_folder, output_name(image, number))
+            if output_path in saved:
+                raise ValueError(f"Two images would be saved to {output_path}, last one: {image}")
+            save_image(cutout, output_path)
+            saved.add(output_path)
+            output_paths.append(output_path)
+            print(f"✅ [{number}] Saved to: {output_path}")
+        return output_paths
+
+
+def image_size(image):
+    return (image.shape[1], image.shape[0]) if isinstance(image, np.ndarray) else image.size
+
+
+def downscale_pixels(pixels, max_side):
+    """
+    Area downscale of an array to max_side, first by a whole factor (OpenCV's fast path) on the cropped array.
+    """
+    height, width = pixels.shape[:2]
+    factor = max(width, height) // max_side
+    if factor > 1:
+        height, width = height // factor, width // factor
+        pixels = cv2.resize(pixels[: height * factor, : width * factor], (width, height), interpolation=cv2.INTER_AREA)
+    scale = max_side / max(width, height)
+    size = (round(width * scale), round(height * scale))
+    return cv2.resize(pixels, size, interpolation=cv2.INTER_AREA) if scale < 1 else pixels
+
+
+def gray(pixels):
+    # Channel order does not matter much for a guide, the weights of RGB are used for BGR arrays too
+    return cv2.cvtColor(pixels, cv2.COLOR_RGB2GRAY)
+
+
+def upscale_mask(mask, small_guide, guide, radius=GUIDED_RADIUS, eps=GUIDED_EPS):
+    """
+    Upscales a low resolution mask with a fast guided filter (He & Sun): the local linear model
+    mask = a * guide + b is fitted on the downscaled image, its coefficients are upscaled and applied
+    to the full resolution luma, so the mask edges follow the edges of the original instead of being blurred.
+    :param mask: Mask of the downscaled image, uint8
+    :param small_guide: Luma of the downscaled image, uint8
+    :param guide: Luma of the full resolution image, uint8
+    :return: Full resolution mask, uint8
+    """
+    size = (2 * radius + 1, 2 * radius + 1)
+
+    def box(a):
+        return cv2.boxFilter(a, -1, size)
+
+    small_guide = small_guide.astype(np.float32) / 255
+    mask = mask.astype(np.float32) / 255
+    mean_guide, mean_mask = box(small_guide), box(mask)
+    a = (box(small_guide * mask) - mean_guide * mean_mask) / (box(small_guide * small_guide) - mean_guide**2 + eps)
+    b = mean_mask - a * mean_guide
+    # Scaled so they apply directly to the 0-255 luma and give a 0-255 mask
+    height, width = guide.shape
+    a = cv2.resize(box(a), (width, height), interpolation=cv2.INTER_LINEAR)
+    b = cv2.resize(box(b) * 255, (width, height), interpolation=cv2.INTER_LINEAR)
+    alpha = guide.astype(np.float32)
+    alpha *= a
+    alpha += b
+    return np.clip(alpha, 0, 255, out=alpha).astype(np.uint8)
+
+
+def remove_background_folder(
+    input_folder,
+    output_folder,
+    workers=None,
+    threads=None,
+    model_name=DEFAULT_MODEL,
+    chunksize=4,
+    mask_max_side=None,
+):
+    """
+    Removes the background of all the images of a folder, sharded across worker processes.
+    One ONNX session does not keep many cores busy, so each worker keeps its own warm session with
+    `threads` intra-op threads, workers x threads being the number of CPUs by default.
+    See benchmark_remove_background.py for the best split of a machine.
+    The cutouts are saved as PNG files in output_folder, keeping the sub folders and the source extension
+    (sub/a.jpg -> sub/a.jpg.png, see output_name), so no two images share a cutout, even in the input folder.
+    :param workers: Worker processes, defaults to the number of CPUs divided by threads
+    :param threads: ONNX Runtime threads per worker, defaults to the number of CPUs divided by workers
+    :param chunksize: Number of images sent to a worker at once
+    :param mask_max_side: Optional fast mode, see BackgroundRemover.remove_downscaled
+    :return: (input path, output path, error) for every image, the output path being None on errors
+    """
+    workers, threads = worker_split(workers, threads)
+    paths = sorted(find_images(input_folder))
+    output_paths = [os.path.join(output_folder, os.path.relpath(path, input_folder) + ".png") for path in paths]
+    total = len(paths)
+    print(f"========== Removing background of {total} images with {workers} workers x {threads} threads ==========")
+    results = []
+    with start_workers(workers, threads, model_name, mask_max_side) as executor:
+        for count, result in enumerate(executor.map(remove_file, paths, output_paths, chunksize=chunksize), 1):
+            results.append(result)
+            input_path, output_path, error = result
+            print(f"[{count}/{total}] {'❌ ' + error if error else '✅ ' + output_path}: [{input_path}]")
+    return results
+
+
+def worker_split(workers=None, threads=None, cpus=None):
+    """
+    Completes a workers x threads split so that it uses all the CPUs, one thread per worker by default.
+    """
+    cpus = cpus or os.cpu_count()
+    if workers is None:
+        threads = threads or 1
+        workers = max(1, cpus // threads)
+    elif threads is None:
+        threads = max(1, cpus // workers)
+    return workers, threads
+
+
+def start_workers(workers, threads, model_name=DEFAULT_MODEL, mask_max_side=None):
+    return ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(model_name, threads, mask_max_side)
+    )
+
+
+def init_worker(model_name, threads, mask_max_side=None):
+    global _worker_remover
+    # rembg sizes the ONNX Runtime thread pools of new sessions from OMP_NUM_THREADS
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    _worker_remover = BackgroundRemover(model_name, mask_max_side=mask_max_side)
+
+
+def remove_file(input_path, output_path):
+    """
+    Worker task: removes the background of one file, turning any failure into an error message.
+    :return: (input path, output path, error)
+    """
+    try:
+        _, img = load_image(input_path)
+        cutout = _worker_remover.remove(img)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        save_image(cutout, output_path)
+        return input_path, output_path, None
+    except Exception as e:
+        return input_path, None, f"{type(e).__name__}: {e}"
+
+
+def prefetch(function, items, queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Runs function(item) for the items in a background thread, at most queue_size results ahead of the consumer.
+    Results are yielded in order, an exception is raised at the position of the failing item.
+    """
+    results = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    return
+                results.put((function(item), None))
+            results.put((_DONE, None))
+        except Exception as e:
+            results.put((None, e))
+        finally:
+            # Lets a prefetching generator upstream stop its own thread too
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            result, error = results.get()
+            if error is not None:
+                raise error
+            if result is _DONE:
+                return
+            yield result
+    finally:
+        # The consumer stopped early: unblock the producer until it notices
+        stop.set()
+        while thread.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def load_image(image):
+    """
+    Decodes an image path, images already in memory are passed as they are.
+    :return: (image, decoded image) pair
+    """
+    if isinstance(image, (str, os.PathLike)):
+        with Image.open(image) as img:
+            img.load()
+        return image, img
+    return image, image
+
+
+def output_name(image, number):
+    # The source extension is kept (a.jpg -> a.jpg.png), so a.jpg and a.png never share a cutout
+    # and a cutout saved next to its source never overwrites it
+    if isinstance(image, (str, os.PathLike)):
+        return os.path.basename(image) + ".png"
+    return f"image_{number}.png"
+
+
+def save_image(cutout, output_path):
+    if isinstance(cutout, np.ndarray):
+        cv2.imwrite(output_path, cutout)
+    else:
+        cutout.save(output_path)
+
+
 if __name__ == "__main__":
     print("####### Test: remove background from image #######")
     file_name = "blue_banner"
@@ -49,3 +357,10 @@ if __name__ == "__main__":
     print("-----------------------------")
     remove_bg_numpy(input_path, f"{output_path}{file_name}_3.png")
     print("-----------------------------")
+    remover = BackgroundRemover()
+    remover.remove_all([input_path, cv2.imread(input_path)], f"{output_path}batch/")
+    print("-----------------------------")
+    remove_background_folder("../resources/", f"{output_path}no_background/")
+    print("-----------------------------")
+    remove_background_folder("../resources/", f"{output_path}no_background_fast/", mask_max_side=1024)
+    print("-----------------------------")
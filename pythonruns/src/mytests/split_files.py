@@ -1,21 +1,76 @@
 import argparse
+import bz2
 import datetime
+import gzip
+import heapq
 import logging
+import lzma
 import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 
+SIZE_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+COPY_BUFFER_SIZE = 1024 * 1024
+# Streaming codecs by file extension, zstd needs the optional "zstandard" package
+CODECS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open, ".zst": None}
+# Sortable timestamp at the start of a log record, e.g. 2024-09-25 10:00:00,123
+TIMESTAMP_REGEX = r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?"
 
-def split_file(file_path, num_chunks) -> None:
+
+def split_file(file_path, num_chunks=None, chunk_size=None, record_start=None, workers=1, compress=None) -> None:
     """
-    Splits a text input file (like a log) into a given number of chunks.
-    Example: 1 big file split into 10 small ones.
+    Splits a text input file (like a log) into a given number of chunks, or into chunks of a target byte size.
+    Example: 1 big file split into 10 small ones, or into parts of about 512 MB each.
     Use: python split_file.py path_to_your_log_file.log 10
+    Use: python split_file.py path_to_your_log_file.log --chunk-size 512M --workers 4
+    Use: python split_file.py path_to_your_log_file.log.gz --chunk-size 512M --compress gz
+    Compressed inputs (.gz, .bz2, .xz, .zst) are decompressed on the fly, never to disk.
     :param file_path: Path to the file to be split
-    :param num_chunks: Number of chunks to split the file into
+    :param num_chunks: Number of chunks to split the file into (by line count)
+    :param chunk_size: Target size in bytes of each chunk, cut on the next newline (or record start)
+    :param record_start: Regex matching the first line of a record, so multi-line records are not cut in half
+    :param workers: Number of parts written at the same time (needs chunk_size, as parts are byte ranges)
+    :param compress: Optional codec extension for the parts (gz, bz2, xz or zst)
     :return: None
     """
-    # Set up logging to file and console
+    if (num_chunks is None) == (chunk_size is None):
+        raise ValueError("Use either num_chunks or chunk_size to split the file.")
+    if workers > 1 and chunk_size is None:
+        raise ValueError("Parallel workers need chunk_size, line chunks are written in a single pass.")
+    if record_start and chunk_size is None:
+        raise ValueError("record_start needs chunk_size, line chunks are cut on line counts only.")
+    if compress and f".{compress.lstrip('.')}" not in CODECS:
+        raise ValueError(f"Unknown codec: {compress}, use one of {', '.join(c.lstrip('.') for c in CODECS)}")
+
+    log_file = setup_logging("split_file")
+
+    if chunk_size is not None:
+        logging.info(f"Starting to split file: {file_path} into chunks of {chunk_size} bytes.")
+        if codec_extension(file_path):
+            if workers > 1:
+                logging.warning("Compressed input is read as a single stream, --workers is ignored.")
+            split_stream_by_size(file_path, chunk_size, record_start, compress)
+        else:
+            split_by_size(file_path, chunk_size, record_start, workers, compress)
+    else:
+        logging.info(f"Starting to split file: {file_path} into {num_chunks} chunks.")
+        split_by_lines(file_path, num_chunks, compress)
+
+    logging.info(f"Finished splitting file: {file_path}")
+    logging.info(f"Logs available at: {log_file}")
+
+
+def setup_logging(prefix) -> str:
+    """
+    Sets up logging to a dated log file and to the console.
+    :param prefix: Prefix of the log file name
+    :return: Path of the log file
+    """
     date_format = "%Y-%m-%d_%H:%M:%S"
-    log_file = f"split_file_{datetime.datetime.now().strftime(date_format)}.log"
+    log_file = f"{prefix}_{datetime.datetime.now().strftime(date_format)}.log"
     logging.basicConfig(
         filename=log_file,
         level=logging.INFO,
@@ -27,39 +82,473 @@ def split_file(file_path, num_chunks) -> None:
     console.setFormatter(formatter)
     root_logger = logging.getLogger()
     root_logger.addHandler(console)
+    return log_file
 
-    logging.info(f"Starting to split file: {file_path} into {num_chunks} chunks.")
 
-    file_name, file_extension = os.path.splitext(file_path)
+def split_by_lines(file_path, num_chunks, compress=None) -> None:
+    """
+    Splits a file into a number of chunks with the same line count, the last chunk takes the remainder.
+    The file is streamed twice (count, then write) so memory use does not grow with the file size.
+    :param file_path: Path to the file to be split
+    :param num_chunks: Number of chunks to split the file into
+    :param compress: Optional codec extension for the parts
+    :return: None
+    """
+    # First pass: count the lines without keeping them in memory
+    total_lines = count_lines(file_path)
+    chunk_size = total_lines // num_chunks
 
-    with open(file_path, "r") as file:
-        lines = file.readlines()
-        chunk_size = len(lines) // num_chunks
+    # Second pass: stream the lines into each chunk, the last one takes the remainder
+    with open_file(file_path, "r") as file:
         for i in range(num_chunks):
-            start = i * chunk_size
-            end = start + chunk_size if i < num_chunks - 1 else None
-            output_file_name = f"{file_name}_part_{i + 1}{file_extension}"
-            with open(output_file_name, "w") as output_file:
-                output_file.writelines(lines[start:end])
-
-            # Log the output file name
-            # format to 2 decimal digits
-            logging.info(
-                f"Split file created: {output_file_name}: {(os.path.getsize(output_file_name)/1024/1024):.2f} MB"
-            )
+            output_file_name = part_name(file_path, i + 1, compress)
+            start_time = time.perf_counter()
+            with open_file(output_file_name, "w") as output_file:
+                if i < num_chunks - 1:
+                    output_file.writelines(islice(file, chunk_size))
+                else:
+                    output_file.writelines(file)
 
-    logging.info(f"Finished splitting file: {file_path}")
+            log_part(output_file_name, time.perf_counter() - start_time)
+
+
+def split_by_size(file_path, chunk_size, record_start=None, workers=1, compress=None) -> None:
+    """
+    Splits a file into chunks of about chunk_size bytes, each one ending on a newline (or before a record start).
+    Once the boundaries are known every part is an independent byte range, so parts can be copied in parallel.
+    With compress="gz" every part is a gzip member, so the parts concatenated are still a valid gzip file.
+    :param file_path: Path to the file to be split
+    :param chunk_size: Target size in bytes of each chunk
+    :param record_start: Optional regex matching the first line of a record
+    :param workers: Number of parts copied at the same time
+    :param compress: Optional codec extension for the parts
+    :return: None
+    """
+    boundaries = find_chunk_boundaries(file_path, chunk_size, record_start)
+    parts = range(1, len(boundaries))
+    jobs = (
+        [file_path] * len(parts),
+        [part_name(file_path, i, compress) for i in parts],
+        boundaries[:-1],
+        boundaries[1:],
+        [compress] * len(parts),
+    )
+
+    # Plain copies happen in the kernel without the GIL, so threads are enough;
+    # compressing is CPU bound, so each part gets its own process
+    executor_class = ProcessPoolExecutor if compress and workers > 1 else ThreadPoolExecutor
+    with executor_class(max_workers=max(1, workers)) as executor:
+        for output_file_name, elapsed in executor.map(timed_copy_range, *jobs):
+            log_part(output_file_name, elapsed)
+
+
+def split_stream_by_size(file_path, chunk_size, record_start=None, compress=None) -> None:
+    """
+    Splits a compressed file into chunks of about chunk_size uncompressed bytes, decompressing it on the fly.
+    Compressed streams can not seek, so lines are read in one pass, cutting with the same rules as split_by_size.
+    :param file_path: Path to the compressed file to be split
+    :param chunk_size: Target size in bytes of each chunk
+    :param record_start: Optional regex matching the first line of a record
+    :param compress: Optional codec extension for the parts
+    :return: None
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"Chunk size must be positive: {chunk_size}")
+    pattern = re.compile(record_start.encode()) if record_start else None
+    part, output_file, output_path, written = 0, None, None, 0
+    start_time = time.perf_counter()
+
+    with open_file(file_path, "rb") as file:
+        try:
+            for line in file:
+                if output_file is None or (written >= chunk_size and (pattern is None or pattern.match(line))):
+                    if output_file is not None:
+                        output_file.close()
+                        log_part(output_path, time.perf_counter() - start_time)
+                    part += 1
+                    # bz2/lzma file objects have no name, the path is kept to log the part
+                    output_path = part_name(file_path, part, compress)
+                    output_file = open_file(output_path, "wb")
+                    written = 0
+                    start_time = time.perf_counter()
+                output_file.write(line)
+                written += len(line)
+            if output_file is None:
+                # Empty input still gives one (empty) part, like the seek based split
+                output_path = part_name(file_path, 1, compress)
+                output_file = open_file(output_path, "wb")
+        finally:
+            if output_file is not None:
+                output_file.close()
+    log_part(output_path, time.perf_counter() - start_time)
+
+
+def timed_copy_range(source_path, output_path, start, end, compress=None) -> tuple[str, float]:
+    """
+    Copies a byte range into a new file and measures how long it took.
+    :param source_path: Path to the source file
+    :param output_path: Path to the file to be written
+    :param start: First byte offset to copy
+    :param end: Byte offset where the copy stops
+    :param compress: Optional codec extension for the output
+    :return: Output path and elapsed seconds
+    """
+    start_time = time.perf_counter()
+    if compress:
+        compress_range(source_path, output_path, start, end)
+    else:
+        copy_range(source_path, output_path, start, end)
+    return output_path, time.perf_counter() - start_time
+
+
+def log_part(output_file_name, elapsed, label="Split file created") -> None:
+    """
+    Logs a created file with its size and write throughput.
+    :param output_file_name: Path to the file
+    :param elapsed: Seconds spent writing the file
+    :param label: Start of the log message
+    :return: None
+    """
+    # format to 2 decimal digits
+    size_mb = os.path.getsize(output_file_name) / 1024 / 1024
+    throughput = size_mb / elapsed if elapsed > 0 else 0.0
+    logging.info(f"{label}: {output_file_name}: {size_mb:.2f} MB ({throughput:.2f} MB/s)")
+
+
+def count_lines(file_path) -> int:
+    """
+    Counts the lines of a text file reading it line by line, so memory use stays flat.
+    Lines are counted with the same newline rules used to split the file.
+    :param file_path: Path to the file
+    :return: Number of lines in the file
+    """
+    with open_file(file_path, "r") as file:
+        return sum(1 for _ in file)
+
+
+def find_chunk_boundaries(file_path, chunk_size, record_start=None) -> list[int]:
+    """
+    Finds the byte offsets where each chunk starts, seeking straight to every approximate boundary
+    and moving forward to the next line start, so only O(num_chunks) seeks are needed.
+    :param file_path: Path to the file
+    :param chunk_size: Target size in bytes of each chunk
+    :param record_start: Optional regex matching the first line of a record (e.g. a log timestamp)
+    :return: Sorted offsets, starting with 0 and ending with the file size
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"Chunk size must be positive: {chunk_size}")
+    pattern = re.compile(record_start.encode()) if record_start else None
+    file_size = os.path.getsize(file_path)
+    boundaries = [0]
+
+    with open(file_path, "rb") as file:
+        target = chunk_size
+        while target < file_size:
+            # Step back one byte so a target landing exactly on a line start is kept
+            file.seek(target - 1)
+            file.readline()
+            boundary = file.tell()
+            if pattern:
+                # Move forward until a line starts a new record
+                while True:
+                    line = file.readline()
+                    if not line or pattern.match(line):
+                        break
+                    boundary = file.tell()
+            if boundary >= file_size:
+                break
+            boundaries.append(boundary)
+            target = boundary + chunk_size
+
+    boundaries.append(file_size)
+    return boundaries
+
+
+def copy_range(source_path, output_path, start, end, zero_copy=True) -> None:
+    """
+    Copies the bytes [start, end) of a file into a new file.
+    Uses os.copy_file_range / os.sendfile so the data never leaves the kernel, and falls back to a
+    buffered read/write loop where those calls are not available (other OS, filesystem or Python build).
+    :param source_path: Path to the source file
+    :param output_path: Path to the file to be written
+    :param start: First byte offset to copy
+    :param end: Byte offset where the copy stops
+    :param zero_copy: Try the kernel copy calls first
+    :return: None
+    """
+    with open(source_path, "rb") as source, open(output_path, "wb", buffering=0) as output:
+        copy_between(source, output, start, end, zero_copy)
+
+
+def copy_between(source, output, start, end, zero_copy=True) -> None:
+    """
+    Copies the bytes [start, end) of an open file at the current position of an open (unbuffered) output file.
+    :param source: Source file opened in binary mode
+    :param output: Output file opened in binary mode, with buffering=0
+    :param start: First byte offset to copy
+    :param end: Byte offset where the copy stops
+    :param zero_copy: Try the kernel copy calls first
+    :return: None
+    """
+    offset = copy_range_zero_copy(source.fileno(), output.fileno(), start, end) if zero_copy else start
+
+    # Buffered fallback, also finishes a kernel copy that stopped halfway
+    source.seek(offset)
+    remaining = end - offset
+    while remaining > 0:
+        buffer = source.read(min(COPY_BUFFER_SIZE, remaining))
+        if not buffer:
+            break
+        output.write(buffer)
+        remaining -= len(buffer)
+
+
+def copy_range_zero_copy(source_fd, output_fd, start, end) -> int:
+    """
+    Copies a byte range between two file descriptors with kernel calls, writing at the output position.
+    :param source_fd: Source file descriptor
+    :param output_fd: Output file descriptor
+    :param start: First byte offset to copy
+    :param end: Byte offset where the copy stops
+    :return: Offset reached, equal to end unless the kernel calls are not supported
+    """
+    offset = start
+    if hasattr(os, "copy_file_range"):
+        try:
+            while offset < end:
+                copied = os.copy_file_range(source_fd, output_fd, end - offset, offset)
+                if copied == 0:
+                    break
+                offset += copied
+            return offset
+        except OSError:
+            # Not supported for these files (e.g. cross-device on an old kernel), try sendfile
+            pass
+    if hasattr(os, "sendfile"):
+        try:
+            while offset < end:
+                sent = os.sendfile(output_fd, source_fd, offset, end - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError:
+            # e.g. macOS only sends to sockets, the buffered copy takes over
+            pass
+    return offset
+
+
+def compress_range(source_path, output_path, start, end) -> None:
+    """
+    Copies the bytes [start, end) of a file into a new compressed file, the codec comes from output_path.
+    :param source_path: Path to the source file
+    :param output_path: Path to the compressed file to be written
+    :param start: First byte offset to copy
+    :param end: Byte offset where the copy stops
+    :return: None
+    """
+    with open(source_path, "rb") as source, open_file(output_path, "wb") as output:
+        source.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            buffer = source.read(min(COPY_BUFFER_SIZE, remaining))
+            if not buffer:
+                break
+            output.write(buffer)
+            remaining -= len(buffer)
+
+
+def codec_extension(file_path) -> str | None:
+    """
+    Gets the compression extension of a file.
+    :param file_path: Path to the file
+    :return: The codec extension (like ".gz"), or None for a plain file
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    return extension if extension in CODECS else None
+
+
+def open_file(file_path, mode):
+    """
+    Opens a plain or compressed file, picking the streaming codec from the extension.
+    Text modes use the same newline rules as the built-in open().
+    :param file_path: Path to the file
+    :param mode: "r", "w", "rb" or "wb"
+    :return: A file object
+    """
+    extension = codec_extension(file_path)
+    if extension is None:
+        return open(file_path, mode)
+    mode = mode if "b" in mode else f"{mode}t"
+    if extension == ".zst":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("Reading or writing .zst files needs the zstandard package: pip install zstandard") from e
+        return zstandard.open(file_path, mode)
+    return CODECS[extension](file_path, mode)
+
+
+def part_name(file_path, number, compress=None) -> str:
+    """
+    Builds the name of a part, dropping the codec extension of a compressed input.
+    Example: app.log.gz -> app_part_1.log (or app_part_1.log.gz with compress="gz")
+    :param file_path: Path to the file being split
+    :param number: Part number, starting at 1
+    :param compress: Optional codec extension for the part
+    :return: Path of the part
+    """
+    if codec_extension(file_path):
+        file_path = os.path.splitext(file_path)[0]
+    file_name, file_extension = os.path.splitext(file_path)
+    suffix = f".{compress.lstrip('.')}" if compress else ""
+    return f"{file_name}_part_{number}{file_extension}{suffix}"
+
+
+def merge_files(file_path, output_path=None, by_timestamp=False, timestamp_regex=TIMESTAMP_REGEX) -> str:
+    """
+    Merges the parts written by split_file (file_part_1.ext, file_part_2.ext, ...) back into one file.
+    Parts are checked to be complete (1..N, no gaps) and concatenated in order with kernel zero-copy calls.
+    With by_timestamp the parts are merged by time instead (k-way heap merge), e.g. to re-sort the logs
+    of several hosts: each part must be sorted, only one record per part is kept in memory.
+    Use: python split_files.py path_to_your_log_file.log --merge [--by-timestamp]
+    :param file_path: Path of the original file, the parts are found next to it
+    :param output_path: Path of the merged file, defaults to file_path (which must not exist)
+    :param by_timestamp: Interleave the records of all parts by their timestamp
+    :param timestamp_regex: Regex finding the timestamp of a record, lines without it belong to the previous record
+    :return: Path of the merged file
+    """
+    parts = find_parts(file_path)
+    output_path = output_path or file_path
+    if os.path.exists(output_path):
+        raise FileExistsError(f"Merged file already exists: {output_path}")
+
+    log_file = setup_logging("merge_files")
+    logging.info(f"Starting to merge {len(parts)} parts into: {output_path}")
+    start_time = time.perf_counter()
+
+    if by_timestamp:
+        pattern = re.compile(timestamp_regex.encode())
+        files = [open_file(part, "rb") for part in parts]
+        try:
+            with open_file(output_path, "wb") as output:
+                merged = heapq.merge(*(read_records(file, pattern) for file in files), key=lambda record: record[0])
+                for _, record in merged:
+                    output.write(record)
+        finally:
+            for file in files:
+                file.close()
+    elif codec_extension(output_path) or any(codec_extension(part) for part in parts):
+        with open_file(output_path, "wb") as output:
+            for part in parts:
+                with open_file(part, "rb") as source:
+                    shutil.copyfileobj(source, output, COPY_BUFFER_SIZE)
+    else:
+        with open(output_path, "wb", buffering=0) as output:
+            for part in parts:
+                with open(part, "rb") as source:
+                    copy_between(source, output, 0, os.path.getsize(part))
+
+    log_part(output_path, time.perf_counter() - start_time, "Merged file created")
+    logging.info(f"Finished merging file: {output_path}")
     logging.info(f"Logs available at: {log_file}")
+    return output_path
+
+
+def find_parts(file_path) -> list[str]:
+    """
+    Finds the parts of a split file and checks that none is missing.
+    :param file_path: Path of the original file
+    :return: Paths of the parts, ordered by part number
+    """
+    if codec_extension(file_path):
+        file_path = os.path.splitext(file_path)[0]
+    folder = os.path.dirname(file_path) or "."
+    file_name, file_extension = os.path.splitext(os.path.basename(file_path))
+    codecs = "|".join(re.escape(codec) for codec in CODECS)
+    pattern = re.compile(rf"{re.escape(file_name)}_part_(\d+){re.escape(file_extension)}(?:{codecs})?")
+
+    parts = {}
+    for name in os.listdir(folder):
+        match = pattern.fullmatch(name)
+        if match:
+            number = int(match.group(1))
+            if number in parts:
+                raise ValueError(f"Duplicated part {number}: {parts[number]} and {os.path.join(folder, name)}")
+            parts[number] = os.path.join(folder, name)
 
+    if not parts:
+        raise FileNotFoundError(f"No parts found for: {file_path}")
+    missing = sorted(set(range(1, max(parts) + 1)) - parts.keys())
+    if missing:
+        raise ValueError(f"Missing parts for {file_path}: {missing}")
+    return [parts[number] for number in sorted(parts)]
 
-# Parsing command line arguments
-parser = argparse.ArgumentParser(description="Split a large log file into smaller chunks.")
-parser.add_argument("file_path", type=str, help="Path to the log file to be split.")
-parser.add_argument("num_chunks", type=int, help="Number of chunks to split the file into.")
 
-args = parser.parse_args()
+def read_records(file, pattern):
+    """
+    Reads the records of a log file, a record is a line with a timestamp plus the following lines without one.
+    :param file: File opened in binary mode
+    :param pattern: Compiled bytes regex finding the timestamp
+    :return: Generator of (timestamp, record bytes)
+    """
+    timestamp, record = b"", []
+    for line in file:
+        match = pattern.search(line)
+        if match and record:
+            yield timestamp, b"".join(record)
+            record = []
+        if match:
+            timestamp = match.group(0)
+        record.append(line)
+    if record:
+        yield timestamp, b"".join(record)
+
+
+def parse_size(size) -> int:
+    """
+    Parses a human readable size like 512M, 1G or 100KB into bytes.
+    :param size: Size as text, plain numbers are bytes
+    :return: Size in bytes
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*", str(size), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {size}")
+    number, unit = match.groups()
+    return int(float(number) * SIZE_UNITS.get(unit.upper(), 1))
+
 
 if __name__ == "__main__":
+    # Parsing command line arguments
+    parser = argparse.ArgumentParser(description="Split a large log file into smaller chunks, or merge them back.")
+    parser.add_argument("file_path", type=str, help="Path to the log file to be split.")
+    parser.add_argument("num_chunks", type=int, nargs="?", help="Number of chunks to split the file into.")
+    parser.add_argument("--chunk-size", type=parse_size, help="Target size of each chunk, e.g. 512M or 1G.")
+    parser.add_argument(
+        "--record-start",
+        type=str,
+        help="Regex matching the first line of a record, e.g. '^\\d{4}-\\d{2}-\\d{2}' (needs --chunk-size).",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Parts written in parallel (needs --chunk-size).")
+    parser.add_argument(
+        "--compress",
+        choices=[codec.lstrip(".") for codec in CODECS],
+        help="Compress each part with this codec, e.g. gz.",
+    )
+    parser.add_argument("--merge", action="store_true", help="Merge the parts of file_path back into one file.")
+    parser.add_argument("--by-timestamp", action="store_true", help="Merge the parts by log timestamp (with --merge).")
+    parser.add_argument("--output", type=str, help="Path of the merged file (with --merge), defaults to file_path.")
+
+    args = parser.parse_args()
+    if args.merge:
+        merge_files(args.file_path, args.output, args.by_timestamp)
+        parser.exit()
+    if (args.num_chunks is None) == (args.chunk_size is None):
+        parser.error("give either num_chunks or --chunk-size")
+    if args.workers > 1 and args.chunk_size is None:
+        parser.error("--workers needs --chunk-size")
+    if args.record_start and args.chunk_size is None:
+        parser.error("--record-start needs --chunk-size")
+
     # split_file("/home/user/sessions/session_1.json", 5)
     # split_file("/home/user/logs/log_2024-09-25.log", 7)
-    split_file(args.file_path, args.num_chunks)
+    split_file(args.file_path, args.num_chunks, args.chunk_size, args.record_start, args.workers, args.compress)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The database demos import their sibling modules by name, like when run from their folder
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "pythonruns", "src", "mytests", "database"))
+# The image scripts import their siblings by name too (appended, so nothing in there shadows an installed package)
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "pythonruns", "src", "mytests"))
+# Keep the databases of the demos in memory, never touching their files
+os.environ.setdefault("MYTESTS_DB_FOLDER", ":memory:")
@@ -0,0 +1,155 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+from PIL import Image
+
+from pythonruns.src.mytests import compress_images
+from pythonruns.src.mytests.compress_images import (
+    compress_image,
+    compress_jpeg,
+    convert_images,
+)
+
+
+@pytest.fixture
+def image_folder(tmp_path):
+    """Fixture for a folder with a JPEG, and a PNG of the same name."""
+    Image.new("RGB", (80, 60), "red").save(tmp_path / "photo.jpg", quality=95)
+    Image.new("RGB", (80, 60), "blue").save(tmp_path / "photo.png")
+    return tmp_path
+
+
+@pytest.fixture
+def cjpeg(monkeypatch):
+    """Fixture replacing mozjpeg with a fake encoder writing 100 bytes per quality step, recording its calls."""
+    qualities = []
+
+    def fake_cjpeg(input_bytes, quality):
+        qualities.append(quality)
+        return bytes([quality]) * quality * 100
+
+    monkeypatch.setattr(compress_images, "cjpeg", fake_cjpeg)
+    return qualities
+
+
+@pytest.fixture
+def jpeg(tmp_path):
+    """Fixture for a 20 KB file, only read as bytes by compress_jpeg."""
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(os.urandom(20 * 1024))
+    return path
+
+
+class TestCompressJpeg:
+    """Test suite for the mozjpeg quality search."""
+
+    def test_first_quality_fits(self, cjpeg, jpeg):
+        """Test a file fitting at quality 85 is encoded once."""
+        result = compress_jpeg(str(jpeg), 10)
+
+        assert (result.status, result.quality, result.encodes) == ("compressed", 85, 1)
+        assert cjpeg == [85]
+        assert jpeg.read_bytes() == bytes([85]) * 8500
+
+    def test_bisects_lower_qualities(self, cjpeg, jpeg):
+        """Test the highest quality step fitting the budget is found by bisection after 85 and its neighbour step."""
+        result = compress_jpeg(str(jpeg), 5)
+
+        assert (result.status, result.quality) == ("compressed", 50)
+        assert cjpeg[:2] == [85, 80] and result.encodes == len(cjpeg) <= 6
+        assert jpeg.read_bytes() == bytes([50]) * 5000
+
+    def test_no_quality_fits(self, cjpeg, jpeg):
+        """Test the file is left as it is when even the lowest quality is over the budget."""
+        original = jpeg.read_bytes()
+
+        result = compress_jpeg(str(jpeg), 1)
+
+        assert (result.status, result.final_kb) == ("unchanged", result.original_kb)
+        assert jpeg.read_bytes() == original
+
+    def test_failed_replace_keeps_original(self, cjpeg, jpeg, monkeypatch):
+        """Test the original is left whole when the encoded file can not be moved over it, an error record."""
+        original = jpeg.read_bytes()
+
+        def replace(source, destination):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(os, "replace", replace)
+
+        result = compress_image(str(jpeg), 10)
+
+        assert result.status == "error" and "disk full" in result.error
+        assert jpeg.read_bytes() == original
+
+    def test_cjpeg_failure_is_error_record(self, jpeg, monkeypatch):
+        """Test a file mozjpeg can not read becomes an error record."""
+
+        def failing_cjpeg(input_bytes, quality):
+            raise subprocess.CalledProcessError(1, "cjpeg")
+
+        monkeypatch.setattr(compress_images, "cjpeg", failing_cjpeg)
+
+        assert compress_image(str(jpeg), 10).status == "error"
+
+
+def convert(folder, max_size_kb=300):
+    results = convert_images(str(folder), ("WEBP",), max_size_kb, workers=1)["WEBP"]
+    return {os.path.basename(result.path): result.status for result in results}
+
+
+class TestConvertImages:
+    """Test suite for the web format conversion of a folder."""
+
+    def test_same_name_sources_get_their_own_file(self, image_folder):
+        """Test photo.jpg and photo.png are converted to two files, keeping their extension."""
+        assert convert(image_folder) == {"photo.jpg": "converted", "photo.png": "converted"}
+
+        with Image.open(image_folder / "photo.jpg.webp") as jpg, Image.open(image_folder / "photo.png.webp") as png:
+            assert jpg.getpixel((0, 0))[0] > 200 and png.getpixel((0, 0))[2] > 200
+
+    def test_rerun_is_cached(self, image_folder):
+        """Test a second run skips the files already converted."""
+        convert(image_folder)
+
+        assert convert(image_folder) == {"photo.jpg": "cached", "photo.png": "cached"}
+
+    def test_copied_file_is_converted(self, image_folder):
+        """Test a copy of a converted file gets its own converted file, the content hash is not enough."""
+        convert(image_folder)
+        shutil.copy2(image_folder / "photo.jpg", image_folder / "copy.jpg")
+
+        assert convert(image_folder)["copy.jpg"] == "converted"
+        assert (image_folder / "copy.jpg.webp").exists()
+
+    def test_deleted_output_is_converted_again(self, image_folder):
+        """Test a file whose converted file was deleted is not served from the cache."""
+        convert(image_folder)
+        (image_folder / "photo.jpg.webp").unlink()
+
+        assert convert(image_folder) == {"photo.jpg": "converted", "photo.png": "cached"}
+        assert (image_folder / "photo.jpg.webp").exists()
+
+    def test_unchanged_file_is_cached(self, image_folder):
+        """Test a file no quality could fit, so without a converted file, is served from the cache on a rerun."""
+        assert convert(image_folder, 0.01) == {"photo.jpg": "unchanged", "photo.png": "unchanged"}
+
+        assert convert(image_folder, 0.01) == {"photo.jpg": "cached", "photo.png": "cached"}
+
+    def test_replace_drops_the_source_extension(self, image_folder):
+        """Test replacing the originals names the converted file after the source without its extension."""
+        (image_folder / "photo.png").unlink()
+
+        results = convert_images(str(image_folder), ("WEBP",), 300, workers=1, replace=True)["WEBP"]
+
+        assert [result.status for result in results] == ["converted"]
+        assert sorted(os.listdir(image_folder)) == ["photo.webp"]
+
+    def test_replace_rejects_name_clashes(self, image_folder):
+        """Test replacing is refused up front when two sources would become the same file."""
+        with pytest.raises(ValueError, match="photo.webp"):
+            convert_images(str(image_folder), ("WEBP",), 300, workers=1, replace=True)
+
+        assert sorted(os.listdir(image_folder)) == ["photo.jpg", "photo.png"]
@@ -0,0 +1,212 @@
+import csv
+import json
+import re
+import zlib
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from pythonruns.src.mytests.qrcode.generate_qrcode import (
+    dark_runs,
+    generate_bulk,
+    qr_matrix,
+    qr_svg,
+    rasterize_qr,
+    read_payloads,
+    render_qr,
+    unique_names,
+)
+
+
+def decode(img):
+    """Decodes the QR code of a PIL image with OpenCV."""
+    data, _, _ = cv2.QRCodeDetector().detectAndDecode(np.asarray(img.convert("L")))
+    return data
+
+
+@pytest.fixture
+def payloads_csv(tmp_path):
+    """Fixture for a CSV of ticket payloads, with a repeated payload."""
+    path = tmp_path / "tickets.csv"
+    rows = [("ticket-1", "https://example.com/t/1"), ("ticket-2", "https://example.com/t/2")]
+    rows += [(f"ticket-{i}", f"https://example.com/t/{i}") for i in range(3, 11)]
+    rows.append(("again", "https://example.com/t/1"))
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows([("name", "data"), *rows])
+    return path
+
+
+class TestGenerateQrCode:
+    """Test suite for the bulk QR code generator."""
+
+    def test_read_payloads_csv_and_jsonl(self, tmp_path, payloads_csv):
+        """Test both input formats, with and without names."""
+        jsonl = tmp_path / "tickets.jsonl"
+        jsonl.write_text(json.dumps({"name": "a", "data": "x"}) + "\n\n" + json.dumps("y") + "\n")
+        plain = tmp_path / "plain.csv"
+        plain.write_text("first\nsecond\n")
+
+        assert next(iter(read_payloads(str(payloads_csv)))) == ("ticket-1", "https://example.com/t/1")
+        assert list(read_payloads(str(jsonl))) == [("a", "x"), ("2", "y")]
+        assert list(read_payloads(str(plain))) == [("1", "first"), ("2", "second")]
+
+    def test_qr_matrix_is_cached(self):
+        """Test a repeated payload is encoded once, and rendered with exact module boxes."""
+        qr_matrix.cache_clear()
+
+        matrix = qr_matrix("https://example.com")
+        assert qr_matrix("https://example.com") is matrix
+        assert qr_matrix.cache_info().hits == 1
+
+        img = render_qr(matrix, 4)
+        assert img.size == (matrix.shape[0] * 4,) * 2
+        assert decode(img) == "https://example.com"
+
+    def test_rasterize_qr(self):
+        """Test every module becomes an exact box of pixels, centered with whole boxes when a size is given."""
+        matrix = qr_matrix("https://example.com")
+        modules = matrix.shape[0]
+
+        pixels = rasterize_qr(matrix, 3)
+        assert pixels.dtype == bool
+        assert np.array_equal(pixels, np.kron(matrix, np.ones((3, 3), dtype=bool)))
+
+        sized = rasterize_qr(matrix, size=400)
+        box_size = 400 // modules
+        start = (400 - modules * box_size) // 2
+        assert sized.shape == (400, 400)
+        assert not sized[:start].any() and not sized[:, :start].any()
+        end = start + modules * box_size
+        assert np.array_equal(sized[start:end, start:end], rasterize_qr(matrix, box_size))
+
+    def test_rasterize_qr_too_small(self):
+        """Test a size below one pixel per module is rejected."""
+        with pytest.raises(ValueError):
+            rasterize_qr(qr_matrix("https://example.com"), size=10)
+
+    def test_dark_runs(self):
+        """Test the runs of dark modules cover exactly the dark modules."""
+        matrix = qr_matrix("https://example.com")
+
+        painted = np.zeros_like(matrix)
+        for row, column, length in zip(*dark_runs(matrix)):
+            assert not painted[row, column : column + length].any()
+            painted[row, column : column + length] = True
+        assert np.array_equal(painted, matrix)
+
+    def test_qr_svg(self):
+        """Test the SVG path repaints the matrix, and the hole is clipped out with an even-odd rule."""
+        matrix = qr_matrix("https://example.com")
+        modules = matrix.shape[0]
+
+        svg = qr_svg(matrix, 400)
+        assert f'viewBox="0 0 {modules} {modules}" width="400"' in svg
+        painted = np.zeros_like(matrix)
+        for column, row, length in re.findall(r"M(\d+) (\d+)\.5h(\d+)", svg):
+            painted[int(row), int(column) : int(column) + int(length)] = True
+        assert np.array_equal(painted, matrix)
+        assert "clipPath" not in svg
+
+        holed = qr_svg(matrix, hole_ratio=0.25)
+        assert 'clip-rule="evenodd"' in holed and 'clip-path="url(#hole)"' in holed
+
+    def test_generate_pngs(self, tmp_path, payloads_csv):
+        """Test one decodable PNG per payload, named after it."""
+        output = tmp_path / "pngs"
+
+        assert generate_bulk(str(payloads_csv), str(output), workers=2) == 11
+
+        assert len(list(output.glob("*.png"))) == 11
+        with Image.open(output / "ticket-7.png") as img:
+            assert decode(img) == "https://example.com/t/7"
+
+    def test_unique_names(self):
+        """Test repeated names, and names differing by unsafe characters only, get their number appended."""
+        payloads = [("a/b", "1"), ("a_b", "2"), ("c", "3"), ("c", "4"), ("c_4", "5"), ("", "6")]
+
+        names = [name for name, _ in unique_names(payloads)]
+
+        assert names == ["a_b", "a_b_2", "c", "c_4", "c_4_5", "_"]
+
+    def test_generate_svgs_same_names(self, tmp_path):
+        """Test payloads of the same name each get their own file."""
+        path = tmp_path / "same.jsonl"
+        path.write_text("".join(json.dumps({"name": "code", "data": f"x{i}"}) + "\n" for i in range(3)))
+        output = tmp_path / "svgs"
+
+        assert generate_bulk(str(path), str(output), mode="svg", workers=1) == 3
+
+        assert sorted(file.name for file in output.iterdir()) == ["code.svg", "code_2.svg", "code_3.svg"]
+
+    def test_generate_pngs_fixed_mask(self, tmp_path, payloads_csv):
+        """Test codes encoded with a fixed mask pattern still decode."""
+        output = tmp_path / "pngs"
+
+        generate_bulk(str(payloads_csv), str(output), workers=1, mask_pattern=0)
+
+        with Image.open(output / "ticket-3.png") as img:
+            assert decode(img) == "https://example.com/t/3"
+
+    def test_generate_sheets(self, tmp_path, payloads_csv):
+        """Test sprite sheets of columns x rows codes with an index of their positions."""
+        output = tmp_path / "sheets"
+
+        generate_bulk(str(payloads_csv), str(output), mode="sheet", workers=2, columns=2, rows=3)
+
+        assert len(list(output.glob("sheet_*.png"))) == 2
+        with open(output / "index.csv") as f:
+            index = list(csv.DictReader(f))
+        assert index[7] == {"name": "ticket-8", "page": "2", "row": "1", "column": "2"}
+
+    def test_generate_pdf(self, tmp_path, payloads_csv):
+        """Test a multi-page PDF with valid cross references and decodable page images."""
+        output = tmp_path / "tickets.pdf"
+
+        generate_bulk(str(payloads_csv), str(output), mode="pdf", workers=2, columns=1, rows=1, box_size=4)
+
+        data = output.read_bytes()
+        assert data.startswith(b"%PDF-") and data.rstrip().endswith(b"%%EOF")
+        assert re.search(rb"/Type /Pages /Kids \[[^]]*\] /Count 11", data)
+        xref = int(re.search(rb"startxref\n(\d+)", data).group(1))
+        offsets = re.findall(rb"(\d{10}) 00000 n", data[xref:])
+        assert all(data[int(offset) :].startswith(b"%d 0 obj" % number) for number, offset in enumerate(offsets, 1))
+
+        match = re.search(rb"/Width (\d+) /Height (\d+) .*? /Length (\d+) >>\nstream\n", data)
+        width, height, length = (int(value) for value in match.groups())
+        pixels = zlib.decompress(data[match.end() : match.end() + length])
+        assert decode(Image.frombytes("1", (width, height), pixels)) == "https://example.com/t/1"
+
+    def test_generate_svgs(self, tmp_path, payloads_csv):
+        """Test one SVG per payload, sized box_size pixels per module."""
+        output = tmp_path / "svgs"
+
+        assert generate_bulk(str(payloads_csv), str(output), mode="svg", workers=1, box_size=4) == 11
+
+        svg = (output / "ticket-7.svg").read_text()
+        modules = qr_matrix("https://example.com/t/7").shape[0]
+        assert svg.startswith("<svg") and f'width="{modules * 4}"' in svg
+
+    def test_generate_vector_pdf(self, tmp_path, payloads_csv):
+        """Test a vector PDF is valid, drawn with paths, and its size does not grow with the box size."""
+        small, vector, raster = tmp_path / "small.pdf", tmp_path / "vector.pdf", tmp_path / "raster.pdf"
+
+        generate_bulk(str(payloads_csv), str(small), mode="vector_pdf", workers=1, columns=2, rows=2, box_size=4)
+        generate_bulk(str(payloads_csv), str(vector), mode="vector_pdf", workers=1, columns=2, rows=2, box_size=20)
+        generate_bulk(str(payloads_csv), str(raster), mode="pdf", workers=1, columns=2, rows=2, box_size=20)
+
+        data = vector.read_bytes()
+        assert re.search(rb"/Type /Pages /Kids \[[^]]*\] /Count 3", data)
+        xref = int(re.search(rb"startxref\n(\d+)", data).group(1))
+        offsets = re.findall(rb"(\d{10}) 00000 n", data[xref:])
+        assert all(data[int(offset) :].startswith(b"%d 0 obj" % number) for number, offset in enumerate(offsets, 1))
+        content = zlib.decompress(re.search(rb"stream\n(.*?)\nendstream", data, re.DOTALL)[1])
+        assert b"/XObject" not in data and b" re\n" in content
+        assert abs(len(data) - small.stat().st_size) < 100
+        assert len(data) < raster.stat().st_size
+
+    def test_generate_unknown_mode(self, tmp_path, payloads_csv):
+        """Test an unknown output mode is rejected."""
+        with pytest.raises(ValueError):
+            generate_bulk(str(payloads_csv), str(tmp_path), mode="gif")
@@ -0,0 +1,73 @@
+import csv
+import importlib
+import os
+
+import pytest
+from PIL import Image, ImageDraw
+
+QRCODE_FOLDER = os.path.join(os.path.dirname(__file__), "..", "..", "pythonruns", "src", "mytests", "qrcode")
+
+
+@pytest.fixture
+def hole(monkeypatch):
+    """Fixture for the module, importing its sibling generate_qrcode like when run from its folder."""
+    monkeypatch.syspath_prepend(QRCODE_FOLDER)
+    module = importlib.import_module("generate_qrcode_with_midle_empty")
+    module.load_logo.cache_clear()
+    return module
+
+
+@pytest.fixture
+def logo_path(tmp_path):
+    """Fixture for a small 2:1 logo: a red ellipse on a transparent background."""
+    path = tmp_path / "logo.png"
+    logo = Image.new("RGBA", (40, 20), (0, 0, 0, 0))
+    ImageDraw.Draw(logo).ellipse((0, 0, 39, 19), fill=(255, 0, 0, 255))
+    logo.save(path)
+    return str(path)
+
+
+class TestQrWithLogo:
+    """Test suite for the logo compositing of the QR codes with a hole."""
+
+    def test_load_logo_is_cached(self, hole, logo_path):
+        """Test the logo is scaled up to fit the square, keeping its aspect ratio, and loaded once."""
+        logo = hole.load_logo(logo_path, 100)
+
+        assert logo.mode == "RGBA" and logo.size == (100, 50)
+        assert hole.load_logo(logo_path, 100) is logo
+        assert hole.load_logo.cache_info().hits == 1
+
+    def test_qr_with_logo(self, hole, logo_path):
+        """Test the logo is composited in the center and the code still decodes."""
+        img = hole.qr_with_logo("https://example.com", logo_path, 0.25, 400)
+
+        assert img.size == (400, 400)
+        assert img.getpixel((200, 200)) == (255, 0, 0, 255)
+        assert img.getpixel((200, 160))[3] == 0  # Hole left transparent around the logo
+        assert hole.decodes(img, "https://example.com")
+        assert not hole.decodes(img, "https://example.org")
+
+    def test_generate_batch_with_logo(self, hole, logo_path, tmp_path):
+        """Test a code per payload with the logo loaded once, and the codes not decoding reported and not saved."""
+        payloads = tmp_path / "payloads.csv"
+        with open(payloads, "w", newline="") as f:
+            csv.writer(f).writerows([("name", "data")] + [(f"code-{i}", f"https://example.com/{i}") for i in range(4)])
+
+        assert hole.generate_batch_with_logo(str(payloads), str(tmp_path / "codes"), logo_path) == []
+        assert len(list((tmp_path / "codes").glob("code-*.png"))) == 4
+        assert hole.load_logo.cache_info().misses == 1
+
+        failed = hole.generate_batch_with_logo(str(payloads), str(tmp_path / "big"), logo_path, hole_size_ratio=0.5)
+        assert failed == [f"code-{i}" for i in range(4)]
+        assert not list((tmp_path / "big").glob("*.png"))
+
+    @pytest.mark.parametrize("extension", [".svg", ".pdf"])
+    def test_logo_in_vector_file_is_rejected(self, hole, logo_path, tmp_path, extension):
+        """Test a logo with a vector save path raises before anything is rendered or written."""
+        save_path = tmp_path / f"code{extension}"
+
+        with pytest.raises(ValueError, match="raster image"):
+            hole.generate_qr_with_hole("https://example.com", save_path=str(save_path), logo_path=logo_path)
+
+        assert not save_path.exists()
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+from pythonruns.src.mytests.database import json_records
+
+
+@pytest.fixture
+def cursor():
+    """Fixture for a cursor on an in-memory database with the records table."""
+    conn = sqlite3.connect(":memory:")
+    json_records.create_table(conn)
+    yield conn.cursor()
+    conn.close()
+
+
+class TestJsonRecords:
+    """Test suite for the row-per-record helpers shared by the JSON demos."""
+
+    def test_record_row(self):
+        """Test the id is its own column, and the other fields the JSON object of the row."""
+        assert json_records.record_row({"id": 3, "info": "a", "none": None}) == (3, '{"info": "a", "none": null}')
+        assert json_records.record_row({"info": "new"}) == (None, '{"info": "new"}')
+
+    @pytest.mark.parametrize("record_id", ["1", 1.5, True])
+    def test_record_row_rejects_other_ids(self, record_id):
+        """Test an id that is not an integer raises a ValueError naming it."""
+        with pytest.raises(ValueError, match=repr(record_id)):
+            json_records.record_row({"id": record_id})
+
+    def test_record_rows_rejects_duplicate_ids(self):
+        """Test an id given to two records raises a ValueError, the records without id being new ones."""
+        rows = json_records.record_rows([{"id": 1}, {"info": "a"}, {"info": "b"}, {"id": 1}])
+
+        assert [next(rows), next(rows), next(rows)] == [(1, "{}"), (None, '{"info": "a"}'), (None, '{"info": "b"}')]
+        with pytest.raises(ValueError, match="several records"):
+            next(rows)
+
+    def test_read_store(self, cursor):
+        """Test the document is rebuilt with the id first in each record, null fields and empty records kept."""
+        rows = [(2, '{"info": "b", "none": null}'), (1, "{}")]
+        cursor.executemany("INSERT INTO json_data (id, data) VALUES (?, ?)", rows)
+
+        store = json_records.read_store(cursor)
+
+        assert store == {"data": [{"id": 1}, {"id": 2, "info": "b", "none": None}]}
+        assert list(store["data"][1]) == ["id", "info", "none"]
+
+    def test_read_store_empty(self, cursor):
+        """Test an empty table gives an empty document."""
+        assert json_records.read_store(cursor) == {"data": []}
+
+    def test_add_to_store(self):
+        """Test a record is inserted at its id position, without its id field twice."""
+        store = {"data": [{"id": 1}, {"id": 5}]}
+
+        assert json_records.add_to_store(store, {"id": 3, "info": "c"}, 3) is store
+        assert store["data"] == [{"id": 1}, {"id": 3, "info": "c"}, {"id": 5}]
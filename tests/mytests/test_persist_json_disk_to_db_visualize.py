@@ -0,0 +1,142 @@
+import io
+import json
+import sqlite3
+
+import pytest
+
+from pythonruns.src.mytests.database import persist_json_disk_to_db_visualize as db
+
+RECORDS = [
+    {"id": 1, "info": "a ] tricky, string {"},
+    {"id": 2, "info": "b", "score": 12345.5, "tags": [1, [2, 3]]},
+    {"id": 30, "info": "c", "flag": True, "none": None},
+]
+
+
+@pytest.fixture(autouse=True)
+def empty_db():
+    """Fixture emptying the module's in-memory database and its cache before each test."""
+    with db.writes.transaction():
+        db.cursor.execute("DELETE FROM json_data")
+    db.cache.invalidate()
+
+
+class TestStreamingImportExport:
+    """Test suite for the streaming JSON import and export."""
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 1 << 20])
+    def test_iter_json_array(self, chunk_size):
+        """Test the items are streamed whatever the chunk boundaries, the other keys being skipped."""
+        document = {"before": {"data": [0], "x": "]"}, "data": RECORDS + [7, 123456789], "after": [1, 2]}
+        text = json.dumps(document, indent=2)
+
+        assert list(db.iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == document["data"]
+
+    @pytest.mark.parametrize("chunk_size", range(1, 12))
+    def test_iter_json_array_numbers(self, chunk_size):
+        """Test numbers cut by a chunk boundary after a prefix that is a number too ("1." or "12.25E") are whole."""
+        text = '{"skipped": 3.25e2, "data": [1.5, -2, 1e5, 12.25E-3, 100]}'
+
+        assert list(db.iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == [1.5, -2, 1e5, 12.25e-3, 100]
+
+    def test_iter_json_array_empty(self):
+        """Test documents without items."""
+        assert list(db.iter_json_array(io.StringIO('{"data": [ ]}'))) == []
+        assert list(db.iter_json_array(io.StringIO("{}"))) == []
+        assert list(db.iter_json_array(io.StringIO('{"other": [1]}'))) == []
+
+    def test_iter_json_array_invalid(self):
+        """Test a document that is not an object, or is cut, is rejected."""
+        with pytest.raises(ValueError):
+            list(db.iter_json_array(io.StringIO("[1, 2]")))
+        with pytest.raises(ValueError):
+            list(db.iter_json_array(io.StringIO('{"data": [{"id": 1}, {"id"'), chunk_size=4))
+
+    def test_iter_json_array_corrupt_token(self):
+        """Test a corrupt token is rejected once max_pending characters are buffered, not at the end of the file."""
+        source = io.StringIO('{"data": [1, @' + ", 2" * 100000 + "]}")
+
+        with pytest.raises(ValueError):
+            list(db.iter_json_array(source, chunk_size=16, max_pending=64))
+        assert source.tell() <= 64 + 2 * 16
+
+    @pytest.mark.parametrize("value", ['{"id": 1}', "5", "null", '"[1]"'])
+    def test_iter_json_array_not_an_array(self, value):
+        """Test a value of the key that is not an array is rejected, instead of giving no items."""
+        with pytest.raises(ValueError):
+            list(db.iter_json_array(io.StringIO(f'{{"data": {value}}}')))
+
+    def test_import_not_an_array_keeps_records(self, tmp_path):
+        """Test loading a document whose "data" is not an array leaves the previous records untouched."""
+        db.save_data_to_db({"data": RECORDS})
+        path = tmp_path / "records.json"
+        path.write_text('{"data": {"id": 1, "info": "a"}}')
+
+        with pytest.raises(ValueError):
+            db.import_records(db.iter_json_records(str(path)))
+        assert db.load_data_from_db() == {"data": RECORDS}
+
+    @pytest.mark.parametrize("file_name", ["records.json", "records.jsonl"])
+    def test_export_import_round_trip(self, tmp_path, file_name):
+        """Test both file formats are valid, and imported back identical."""
+        db.save_data_to_db({"data": RECORDS})
+        path = str(tmp_path / file_name)
+
+        assert db.export_records(path, batch_size=2) == 3
+        with open(path) as f:
+            if file_name.endswith(".jsonl"):
+                assert [json.loads(line) for line in f] == RECORDS
+            else:
+                assert json.load(f) == {"data": RECORDS}
+
+        db.save_data_to_db({"data": []})
+        assert db.import_records(db.iter_json_records(path), batch_size=2) == 3
+        assert db.load_data_from_db() == {"data": RECORDS}
+
+    def test_export_empty(self, tmp_path):
+        """Test an empty database exports a valid document."""
+        path = tmp_path / "empty.json"
+
+        assert db.export_records(str(path)) == 0
+        assert json.loads(path.read_text()) == {"data": []}
+
+    def test_import_invalidates_cache(self, tmp_path):
+        """Test loading a file replaces the cached store, which is read from the cache otherwise."""
+        db.save_data_to_db({"data": RECORDS[:1]})
+        db.load_data_from_db()
+        misses = db.cache.misses
+        assert db.load_data_from_db() == {"data": RECORDS[:1]} and db.cache.misses == misses
+        path = tmp_path / "records.jsonl"
+        path.write_text("\n".join(json.dumps(record) for record in RECORDS))
+
+        db.import_records(db.iter_json_records(str(path)))
+
+        assert db.load_data_from_db() == {"data": RECORDS}
+
+    def test_records_are_objects(self):
+        """Test a row holding anything else than a JSON object is rejected, like in persist_json_to_db."""
+        with pytest.raises(sqlite3.IntegrityError):
+            db.cursor.execute("INSERT INTO json_data (data) VALUES (?)", ("[1]",))
+
+    def test_import_duplicate_ids_keeps_records(self, tmp_path):
+        """Test a JSON file giving an id to two records is rejected with a ValueError, the records untouched."""
+        db.save_data_to_db({"data": RECORDS})
+        path = tmp_path / "data.json"
+        path.write_text(json.dumps({"data": [{"id": 5, "info": "a"}, {"id": 5, "info": "b"}]}))
+
+        with pytest.raises(ValueError, match="several records"):
+            db.import_records(db.iter_json_records(str(path)))
+
+        assert db.load_data_from_db() == {"data": RECORDS}
+
+    def test_import_failure_keeps_records(self):
+        """Test an import failing halfway leaves the previous records untouched."""
+        db.save_data_to_db({"data": RECORDS})
+
+        def records():
+            yield {"id": 100, "info": "new"}
+            raise ValueError("Invalid JSON document")
+
+        with pytest.raises(ValueError):
+            db.import_records(records(), batch_size=1)
+        assert db.load_data_from_db() == {"data": RECORDS}
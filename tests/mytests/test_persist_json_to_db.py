@@ -0,0 +1,126 @@
+import json
+import sqlite3
+
+import pytest
+
+from pythonruns.src.mytests.database import persist_json_to_db as db
+
+
+@pytest.fixture(autouse=True)
+def empty_db():
+    """Fixture emptying the module's in-memory database and its cache before each test."""
+    with db.writes.transaction():
+        db.cursor.execute("DELETE FROM json_data")
+    db.cache.invalidate()
+
+
+class TestPersistJsonToDb:
+    """Test suite for the row-per-record JSON storage."""
+
+    def test_append_record(self):
+        """Test each record is one row, read back in the {"data": [...]} format with its id first."""
+        first = db.append_record({"info": "a"})
+        second = db.append_record({"info": "b", "tags": ["x"], "none": None})
+
+        assert db.cursor.execute("SELECT COUNT(*) FROM json_data").fetchone()[0] == 2
+        data = db.load_data_from_db()
+        assert data == {"data": [{"id": first, "info": "a"}, {"id": second, "info": "b", "tags": ["x"], "none": None}]}
+        assert list(data["data"][1]) == ["id", "info", "tags", "none"]
+
+    def test_read_data_keeps_id_order(self):
+        """Test the records are read back by id, even with SQLite reversing every scan not explicitly ordered."""
+        db.save_data_to_db({"data": [{"id": record_id, "info": str(record_id)} for record_id in (5, 1, 9, 3)]})
+        db.cursor.execute("PRAGMA reverse_unordered_selects = ON")
+        try:
+            assert [record["id"] for record in db.read_data_from_db()["data"]] == [1, 3, 5, 9]
+        finally:
+            db.cursor.execute("PRAGMA reverse_unordered_selects = OFF")
+
+    def test_records_are_objects(self):
+        """Test a row holding anything else than a JSON object is rejected."""
+        with pytest.raises(sqlite3.IntegrityError):
+            db.cursor.execute("INSERT INTO json_data (data) VALUES (?)", ("[1]",))
+
+    def test_reads_come_from_cache(self):
+        """Test the store is decoded once, and kept up to date by the appends without being read again."""
+        db.append_record({"info": "a"})
+        db.load_data_from_db()
+        misses = db.cache.misses
+
+        record_id = db.append_record({"info": "b"})
+
+        loaded = db.load_data_from_db()
+        assert loaded["data"][-1] == {"id": record_id, "info": "b"}
+        assert db.cache.misses == misses and db.cache.stats()["hits"] >= 1
+        assert db.read_data_from_db() == loaded
+
+    def test_load_returns_copy(self):
+        """Test a loaded store is left as it was by the later appends."""
+        db.append_record({"info": "a"})
+        store = db.load_data_from_db()
+
+        db.append_record({"info": "b"})
+
+        assert [record["info"] for record in store["data"]] == ["a"]
+
+    def test_find_records_cached_until_write(self):
+        """Test query results are cached, and dropped by a write."""
+        db.append_record({"info": "a"})
+        assert db.find_records("info", "a") is db.find_records("info", "a")
+
+        db.append_record({"info": "a"})
+
+        assert len(db.find_records("info", "a")) == 2
+
+    def test_find_records(self):
+        """Test records are filtered on a field by SQLite."""
+        db.save_data_to_db({"data": [{"id": 1, "info": "a"}, {"id": 2, "info": "b"}, {"id": 7, "info": "a"}]})
+
+        assert db.find_records("info", "a") == [{"id": 1, "info": "a"}, {"id": 7, "info": "a"}]
+        assert db.find_records("info", "c") == []
+
+    def test_save_data_to_db_replaces_records(self):
+        """Test saving a document replaces every record, keeping the ids of the file and never reusing one."""
+        old = db.append_record({"info": "old"})
+
+        db.save_data_to_db({"data": [{"id": old + 1, "info": "x"}, {"info": "no id"}]})
+
+        records = db.load_data_from_db()["data"]
+        assert records[0] == {"id": old + 1, "info": "x"}
+        assert records[1]["info"] == "no id" and records[1]["id"] > old + 1
+        assert len(records) == 2
+
+    @pytest.mark.parametrize("records", [[{"id": "1", "info": "x"}], [{"id": 1}, {"id": 1}]])
+    def test_save_data_to_db_rejects_invalid_ids(self, records):
+        """Test string or duplicate ids raise a ValueError, the records being left untouched."""
+        db.append_record({"info": "old"})
+        stored = db.load_data_from_db()
+
+        with pytest.raises(ValueError, match="Invalid record id"):
+            db.save_data_to_db({"data": records})
+
+        assert db.read_data_from_db() == stored
+
+    def test_export_import_json(self, tmp_path):
+        """Test the JSON file round trip."""
+        db.append_record({"info": "a"})
+        db.append_record({"info": "b"})
+        path = tmp_path / "data.json"
+
+        db.export_json(str(path))
+        exported = json.loads(path.read_text())
+        db.save_data_to_db({"data": []})
+        db.import_json(str(path))
+
+        assert db.load_data_from_db() == exported
+        assert [item["info"] for item in exported["data"]] == ["a", "b"]
+
+    def test_retrieve_data(self, monkeypatch):
+        """Test the records are shown like before."""
+        shown = []
+        monkeypatch.setattr(db.messagebox, "showinfo", lambda *args: shown.append(args))
+        db.append_record({"info": "a"})
+
+        db.retrieve_data()
+
+        assert shown[-1][1].endswith("Info: a")
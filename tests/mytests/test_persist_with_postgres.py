@@ -0,0 +1,176 @@
+import os
+import re
+import sqlite3
+
+import psycopg2
+import pytest
+
+from pythonruns.src.mytests.database import persist_with_postgres as pg
+
+# Throwaway PostgreSQL database to run the tests against, e.g. "dbname=test user=test host=localhost".
+# Without it the tests run against a SQLite stand-in of the few psycopg2 features used.
+POSTGRES_DSN = os.environ.get("MYTESTS_POSTGRES_DSN")
+
+
+class StandInCursor:
+    """psycopg2 cursor on SQLite: %s parameters, mogrify (for execute_values) and copy_expert."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.sqlite.cursor()
+        self.itersize = 2000
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cursor.close()
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def execute(self, sql, parameters=()):
+        sql = sql.decode() if isinstance(sql, bytes) else sql
+        sql = sql.replace("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT").replace("%s", "?")
+        self.cursor.execute(sql, parameters)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def mogrify(self, template, parameters):
+        literals = [
+            "NULL" if value is None else str(value) if isinstance(value, (int, float)) else quote(value)
+            for value in parameters
+        ]
+        return template.replace(b"%s", b"{}").decode().format(*literals).encode()
+
+    def copy_expert(self, sql, file):
+        table, columns = re.match(r"COPY (\w+) \(([^)]*)\) FROM STDIN", sql).groups()
+        rows = [[unescape(value) for value in line.split("\t")] for line in file.read().splitlines()]
+        placeholders = ", ".join("?" * len(columns.split(",")))
+        self.cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+
+
+class StandInConnection:
+    """psycopg2 connection on SQLite: `with conn` is a transaction, cursors may be named."""
+
+    encoding = "UTF8"
+    closed = 0
+
+    def __init__(self, path):
+        self.sqlite = sqlite3.connect(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type:
+            self.sqlite.rollback()
+        else:
+            self.sqlite.commit()
+
+    def cursor(self, name=None):
+        return StandInCursor(self)
+
+
+class StandInPool:
+    """ThreadedConnectionPool of SQLite connections to one database file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.idle = []
+        self.opened = 0
+
+    def getconn(self):
+        if not self.idle:
+            self.opened += 1
+            self.idle.append(StandInConnection(self.path))
+        return self.idle.pop()
+
+    def putconn(self, conn, close=False):
+        self.idle.append(conn)
+
+    def closeall(self):
+        for conn in self.idle:
+            conn.sqlite.close()
+
+
+def quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def unescape(value):
+    escapes = {"\\\\": "\\", "\\t": "\t", "\\n": "\n", "\\r": "\r"}
+    return re.sub(r"\\[\\tnr]", lambda match: escapes[match.group()], value)
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    """Fixture for the connection pool of the module, on a throwaway PostgreSQL database or SQLite."""
+    if POSTGRES_DSN:
+        test_pool = pg.ThreadedConnectionPool(1, 4, POSTGRES_DSN)
+    else:
+        test_pool = StandInPool(str(tmp_path / "postgres.db"))
+    monkeypatch.setattr(pg, "pool", test_pool)
+    pg.create_table()
+    with pg.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM data")
+    yield test_pool
+    test_pool.closeall()
+
+
+def rows(fetch_size=pg.FETCH_SIZE):
+    return [info for _, info in pg.iter_rows(fetch_size)]
+
+
+class TestPersistWithPostgres:
+    """Test suite for the pooled, batched PostgreSQL backend."""
+
+    def test_insert_rows(self, pool):
+        """Test the rows are inserted in pages, read back in order by the server-side cursor."""
+        infos = [f"info {i}" for i in range(25)] + ["it's quoted"]
+
+        pg.insert_rows(infos, page_size=10)
+
+        assert rows(fetch_size=7) == infos
+
+    def test_copy_rows(self, pool):
+        """Test the COPY text format survives the characters it escapes."""
+        infos = ["plain", "tab\there", "new\nline", "back\\slash", "carriage\rreturn"]
+
+        pg.copy_rows(infos)
+
+        assert rows() == infos
+
+    def test_failed_batch_is_rolled_back(self, pool):
+        """Test a batch failing halfway inserts nothing, and its connection goes back to the pool."""
+        # NOT NULL violation of the stand-in or of PostgreSQL
+        with pytest.raises((sqlite3.IntegrityError, psycopg2.IntegrityError)):
+            pg.insert_rows(["ok", None], page_size=1)
+
+        assert rows() == []
+        pg.insert_rows(["after"])
+        assert rows() == ["after"]
+        if isinstance(pool, StandInPool):
+            assert pool.opened == 1
+
+    def test_save_and_retrieve_data(self, pool, monkeypatch):
+        """Test the buttons of the app go through the pool."""
+        shown = []
+        monkeypatch.setattr(pg.messagebox, "showinfo", lambda *args: shown.append(args))
+        monkeypatch.setattr(pg.messagebox, "showerror", lambda *args: shown.append(args))
+
+        class Entry:
+            def get(self):
+                return "from the app"
+
+            def delete(self, *args):
+                pass
+
+        monkeypatch.setattr(pg, "entry", Entry())
+
+        pg.save_data()
+        pg.retrieve_data()
+
+        assert shown[0][0] == "Success"
+        assert shown[1][0] == "Retrieved Data" and shown[1][1].endswith("Info: from the app")
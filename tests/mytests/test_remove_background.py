@@ -0,0 +1,276 @@
+import importlib
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import types
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+
+class FakeSession:
+    """rembg session stand-in, no model to download: the mask is the pixels brighter than mid gray."""
+
+    def __init__(self, model_name, **options):
+        self.model_name = model_name
+        self.options = options
+        # rembg sizes the ONNX Runtime thread pools from it when the session is created
+        self.omp_num_threads = os.environ.get("OMP_NUM_THREADS")
+
+    def predict(self, img):
+        return [img.convert("L").point(lambda value: 255 if value > 127 else 0)]
+
+
+def fake_remove(image, session=None):
+    """rembg.remove stand-in: the mask of the session becomes the alpha channel, in the type of the input."""
+    if isinstance(image, bytes):
+        return image
+    if isinstance(image, np.ndarray):
+        mask = session.predict(Image.fromarray(image[..., 2::-1]))[0]
+        return np.dstack([image[..., :3], np.asarray(mask)])
+    cutout = image.convert("RGBA")
+    cutout.putalpha(session.predict(image)[0])
+    return cutout
+
+
+@pytest.fixture(scope="module")
+def rb():
+    """Fixture importing remove_background with a fake rembg module in sys.modules."""
+    rembg = types.ModuleType("rembg")
+    rembg.new_session = FakeSession
+    rembg.remove = fake_remove
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setitem(sys.modules, "rembg", rembg)
+        yield importlib.import_module("pythonruns.src.mytests.remove_background")
+        sys.modules.pop("pythonruns.src.mytests.remove_background", None)
+
+
+@pytest.fixture
+def image_folder(tmp_path):
+    """Fixture for a folder of two-tone images, one of them in a sub folder, and a broken file."""
+    for name, size in [("a.png", (40, 30)), ("b.jpg", (30, 40)), ("sub/c.png", (20, 20))]:
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        img = Image.new("RGB", size, (20, 20, 20))
+        img.paste((240, 240, 240), (0, 0, size[0] // 2, size[1]))
+        img.save(tmp_path / name)
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+    return tmp_path
+
+
+class TestBackgroundRemover:
+    """Test suite for the pipelined BackgroundRemover."""
+
+    def test_iter_remove_keeps_order_and_types(self, rb, image_folder):
+        """Test paths, PIL images and arrays come out in the order received, each cutout in the type of its input."""
+        array = np.zeros((10, 12, 3), dtype=np.uint8)
+        pil_image = Image.new("RGB", (8, 8), "white")
+        images = [str(image_folder / "a.png"), array, pil_image, str(image_folder / "b.jpg")]
+        remover = rb.BackgroundRemover(queue_size=1)
+
+        pairs = list(remover.iter_remove(images))
+
+        assert [image for image, _ in pairs] == images
+        assert isinstance(pairs[1][1], np.ndarray) and pairs[1][1].shape == (10, 12, 4)
+        assert pairs[0][1].mode == pairs[2][1].mode == "RGBA"
+        assert pairs[0][1].getpixel((0, 0))[3] == 255 and pairs[0][1].getpixel((39, 0))[3] == 0
+
+    def test_remove_all_names_the_cutouts(self, rb, image_folder, tmp_path):
+        """Test the cutouts are named after their files, and numbered for images given in memory."""
+        output = tmp_path / "out"
+        remover = rb.BackgroundRemover()
+
+        paths = remover.remove_all([str(image_folder / "b.jpg"), Image.new("RGB", (8, 8))], str(output))
+
+        assert paths == [str(output / "b.jpg.png"), str(output / "image_2.png")]
+        assert all(os.path.exists(path) for path in paths)
+
+    def test_remove_all_keeps_the_source_extension(self, rb, image_folder):
+        """Test a.png and a.jpg get their own cutout, saving next to the sources never overwriting one."""
+        Image.open(image_folder / "b.jpg").save(image_folder / "a.jpg")
+        source = (image_folder / "a.png").read_bytes()
+        remover = rb.BackgroundRemover()
+
+        paths = remover.remove_all([str(image_folder / "a.png"), str(image_folder / "a.jpg")], str(image_folder))
+
+        assert paths == [str(image_folder / "a.png.png"), str(image_folder / "a.jpg.png")]
+        assert (image_folder / "a.png").read_bytes() == source
+
+    def test_remove_all_rejects_same_names(self, rb, image_folder, tmp_path):
+        """Test two files of the same name in different folders raise instead of overwriting the first cutout."""
+        output = tmp_path / "out"
+        (image_folder / "other").mkdir()
+        Image.open(image_folder / "sub" / "c.png").save(image_folder / "other" / "c.png")
+        paths = [str(image_folder / "sub" / "c.png"), str(image_folder / "other" / "c.png")]
+        remover = rb.BackgroundRemover()
+
+        with pytest.raises(ValueError, match="c.png.png"):
+            remover.remove_all(paths, str(output))
+
+        assert os.listdir(output) == ["c.png.png"]
+
+    def test_error_in_reader_thread_is_raised(self, rb, image_folder):
+        """Test a file failing to decode in the reader thread raises at its position, after the previous cutouts."""
+        remover = rb.BackgroundRemover()
+        cutouts = remover.iter_remove([str(image_folder / "a.png"), str(image_folder / "broken.png")])
+
+        assert next(cutouts)[0] == str(image_folder / "a.png")
+        with pytest.raises(Image.UnidentifiedImageError):
+            next(cutouts)
+
+    def test_prefetch_keeps_order(self, rb):
+        """Test the results are yielded in order, whatever the queue size."""
+        assert list(rb.prefetch(lambda item: item * 2, range(50), queue_size=2)) == list(range(0, 100, 2))
+
+    def test_prefetch_stops_early(self, rb):
+        """Test a consumer stopping early stops the producer thread, at most a queue ahead."""
+        calls = []
+
+        def work(item):
+            calls.append(item)
+            return item
+
+        threads = threading.active_count()
+        results = rb.prefetch(work, itertools.count(), queue_size=2)
+        assert [next(results) for _ in range(3)] == [0, 1, 2]
+
+        results.close()
+
+        assert threading.active_count() == threads
+        assert len(calls) <= 3 + 2 + 1
+
+    def test_prefetch_raises_at_failing_item(self, rb):
+        """Test an exception of the function is raised to the consumer after the results before it."""
+
+        def work(item):
+            if item == 3:
+                raise ValueError("bad item")
+            return item
+
+        results = rb.prefetch(work, range(10))
+
+        assert [next(results) for _ in range(3)] == [0, 1, 2]
+        with pytest.raises(ValueError, match="bad item"):
+            next(results)
+
+
+class TestRemoveBackgroundFolder:
+    """Test suite for the background removal sharded across worker processes."""
+
+    @pytest.mark.parametrize(
+        "workers, threads, expected",
+        [(None, None, (8, 1)), (None, 2, (4, 2)), (2, None, (2, 4)), (3, 2, (3, 2)), (None, 16, (1, 16))],
+    )
+    def test_worker_split(self, rb, workers, threads, expected):
+        """Test a partial workers x threads split is completed to use all the CPUs."""
+        assert rb.worker_split(workers, threads, cpus=8) == expected
+
+    def test_init_worker(self, rb, monkeypatch):
+        """Test each worker sets its ONNX Runtime threads before loading its own session."""
+        monkeypatch.setenv("OMP_NUM_THREADS", "0")
+        monkeypatch.setattr(rb, "_worker_remover", None)
+
+        rb.init_worker("u2netp", 3, mask_max_side=64)
+
+        assert os.environ["OMP_NUM_THREADS"] == "3"
+        assert rb._worker_remover.session.omp_num_threads == "3"
+        assert rb._worker_remover.session.model_name == "u2netp"
+        assert rb._worker_remover.mask_max_side == 64
+
+    @pytest.mark.skipif(
+        multiprocessing.get_start_method() != "fork", reason="the workers need the fake rembg of this process"
+    )
+    def test_remove_background_folder(self, rb, image_folder, tmp_path):
+        """Test every image gets a PNG cutout keeping the sub folders, a broken file being an error record."""
+        output = tmp_path / "out"
+
+        results = rb.remove_background_folder(str(image_folder), str(output), workers=2, threads=1, chunksize=1)
+
+        by_name = {os.path.relpath(input_path, image_folder): (path, error) for input_path, path, error in results}
+        assert set(by_name) == {"a.png", "b.jpg", "broken.png", os.path.join("sub", "c.png")}
+        assert by_name["b.jpg"] == (str(output / "b.jpg.png"), None)
+        assert by_name[os.path.join("sub", "c.png")][0] == str(output / "sub" / "c.png.png")
+        assert by_name["broken.png"][0] is None and "UnidentifiedImageError" in by_name["broken.png"][1]
+        with Image.open(output / "sub" / "c.png.png") as cutout:
+            assert cutout.mode == "RGBA" and cutout.getpixel((0, 0))[3] == 255
+
+    @pytest.mark.skipif(
+        multiprocessing.get_start_method() != "fork", reason="the workers need the fake rembg of this process"
+    )
+    def test_remove_background_folder_in_place(self, rb, image_folder):
+        """Test a.jpg and a.png get their own cutout next to them, the sources being left as they are."""
+        Image.open(image_folder / "b.jpg").save(image_folder / "a.jpg")
+        sources = {path: path.read_bytes() for path in image_folder.rglob("*.*")}
+
+        results = rb.remove_background_folder(str(image_folder), str(image_folder), workers=2, threads=1)
+
+        names = sorted(os.path.basename(path) for _, path, _ in results if path)
+        assert names == ["a.jpg.png", "a.png.png", "b.jpg.png", "c.png.png"]
+        assert all(path.read_bytes() == data for path, data in sources.items())
+
+
+@pytest.fixture
+def disc():
+    """Fixture for a light disc on a dark background, and its exact mask."""
+    rows, columns = np.mgrid[:600, :900]
+    mask = (columns - 450) ** 2 + (rows - 300) ** 2 < 203**2
+    pixels = np.where(mask[..., None], np.uint8([220, 200, 180]), np.uint8([30, 40, 60])).astype(np.uint8)
+    return pixels, mask.astype(np.uint8) * 255
+
+
+class TestDownscaledMask:
+    """Test suite for the downscale-infer-upscale mask mode."""
+
+    @pytest.mark.parametrize("shape, expected", [((600, 900, 3), (100, 150, 3)), ((601, 450, 3), (150, 112, 3))])
+    def test_downscale_pixels(self, rb, shape, expected):
+        """Test arrays are downscaled to max_side, keeping their aspect ratio."""
+        assert rb.downscale_pixels(np.zeros(shape, dtype=np.uint8), 150).shape == expected
+
+    def test_downscale_pixels_keeps_small_arrays(self, rb):
+        """Test an array already within max_side is returned as it is."""
+        pixels = np.zeros((100, 80, 3), dtype=np.uint8)
+
+        assert rb.downscale_pixels(pixels, 150) is pixels
+
+    def test_upscale_mask_follows_edges(self, rb, disc):
+        """Test the guided upscale of a low resolution mask gives back the full resolution mask, edges included."""
+        pixels, mask = disc
+        small = rb.downscale_pixels(pixels, 150)
+        small_mask = cv2.resize(mask, (small.shape[1], small.shape[0]), interpolation=cv2.INTER_AREA)
+
+        upscaled = rb.upscale_mask(small_mask, rb.gray(small), rb.gray(pixels))
+        bilinear = cv2.resize(small_mask, (mask.shape[1], mask.shape[0]), interpolation=cv2.INTER_LINEAR)
+
+        assert upscaled.shape == mask.shape and upscaled.dtype == np.uint8
+        error = np.abs(upscaled.astype(int) - mask)
+        assert error.max() <= 64 and error.mean() < 1
+        assert np.abs(bilinear.astype(int) - mask).max() > 64
+
+    @pytest.mark.parametrize("as_array", [False, True])
+    def test_remove_downscaled(self, rb, disc, as_array):
+        """Test large images get the upscaled mask as alpha with their colors untouched, small ones go to rembg."""
+        pixels, mask = disc
+        remover = rb.BackgroundRemover(mask_max_side=150)
+        image = pixels if as_array else Image.fromarray(pixels)
+
+        cutout = np.asarray(remover.remove(image))
+
+        assert isinstance(remover.remove(image), np.ndarray) == as_array
+        assert np.array_equal(cutout[..., :3], pixels)
+        assert np.abs(cutout[..., 3].astype(int) - mask).mean() < 1
+        assert remover.remove(Image.fromarray(pixels[:100, :100])).size == (100, 100)
+
+    def test_remove_downscaled_gray_array(self, rb, disc):
+        """Test a 2-D gray array, as read by cv2.IMREAD_GRAYSCALE, gets 3 gray channels and the alpha."""
+        pixels, mask = disc
+        gray = cv2.cvtColor(pixels, cv2.COLOR_RGB2GRAY)
+        remover = rb.BackgroundRemover(mask_max_side=150)
+
+        cutout = remover.remove(gray)
+
+        assert cutout.shape == (600, 900, 4)
+        assert all(np.array_equal(cutout[..., channel], gray) for channel in range(3))
+        assert np.abs(cutout[..., 3].astype(int) - mask).mean() < 1
@@ -0,0 +1,394 @@
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from pythonruns.src.mytests.resize_images import (
+    JPG_QUALITIES,
+    SCORE_TILE,
+    SCORE_TILES,
+    ImageCache,
+    ImageResult,
+    cache_settings,
+    convert_image,
+    encode_jpg,
+    find_jpg_quality,
+    find_perceptual_quality,
+    jpg_luma,
+    lossless_palette,
+    luma,
+    process_image,
+    process_images,
+    psnr,
+    quantize_png,
+    resize_image,
+    ssim,
+    target_size,
+)
+
+
+@pytest.fixture
+def image_folder(tmp_path):
+    """Fixture for a folder with a big noisy JPEG, a small JPEG and a broken file."""
+    rng = np.random.default_rng(42)
+    noise = rng.integers(0, 256, size=(600, 600, 3), dtype=np.uint8)
+    Image.fromarray(noise).save(tmp_path / "big.jpg", quality=100)
+    Image.new("RGB", (50, 50), "red").save(tmp_path / "small.jpg")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "broken.jpeg").write_bytes(b"not an image")
+    (tmp_path / "notes.txt").write_text("ignored")
+    return tmp_path
+
+
+@pytest.fixture
+def photo():
+    """Fixture for an upscaled noise image, smoother than plain noise like a photo."""
+    rng = np.random.default_rng(7)
+    noise = rng.integers(0, 256, size=(300, 400, 3), dtype=np.uint8)
+    return Image.fromarray(noise).resize((800, 600), Image.BILINEAR)
+
+
+@pytest.fixture
+def color_key_png(tmp_path):
+    """Fixture for an uncompressed RGB PNG of 16 colors with a tRNS color key, and its expected alpha."""
+    rng = np.random.default_rng(17)
+    colors = rng.integers(0, 256, size=(16, 3), dtype=np.uint8)
+    colors[0] = (0, 255, 0)
+    indices = rng.integers(0, 16, size=(50, 50)).repeat(4, axis=0).repeat(4, axis=1)
+    path = tmp_path / "keyed.png"
+    Image.fromarray(colors[indices]).save(path, compress_level=0, transparency=(0, 255, 0))
+    return path, np.where(indices == 0, 0, 255)
+
+
+@pytest.fixture(scope="module")
+def large_photo():
+    """Fixture for a smooth photo-like image wider than 4096 pixels."""
+    rng = np.random.default_rng(13)
+    return Image.fromarray(rng.integers(0, 256, size=(80, 120, 3), dtype=np.uint8)).resize((4800, 3200), Image.BICUBIC)
+
+
+class TestResizeImages:
+    """Test suite for the resize_images pipeline."""
+
+    def test_resize_image_compresses_jpg(self, image_folder):
+        """Test a big JPEG is re-encoded under the size budget."""
+        path = str(image_folder / "big.jpg")
+
+        result = resize_image(path, 300)
+
+        assert result.status == "compressed"
+        assert result.final_kb <= 300
+        assert os.path.getsize(path) / 1024 == pytest.approx(result.final_kb)
+        assert 10 <= result.quality <= 95
+
+    @pytest.mark.parametrize("min_score", [None, 0.5])
+    def test_resize_image_keeps_original_on_failed_write(self, image_folder, monkeypatch, min_score):
+        """Test the original JPEG is left whole when the re-encoded one can not be moved over it."""
+        path = image_folder / "big.jpg"
+        original = path.read_bytes()
+
+        def replace(source, destination):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(os, "replace", replace)
+
+        with pytest.raises(OSError, match="disk full"):
+            resize_image(str(path), 300, min_score=min_score)
+
+        assert path.read_bytes() == original
+
+    def test_resize_image_skips_small_file(self, image_folder):
+        """Test a file already under the budget is not touched."""
+        result = resize_image(str(image_folder / "small.jpg"), 300)
+
+        assert result.status == "skipped"
+        assert result.final_kb == result.original_kb
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_process_images_returns_records(self, image_folder, workers):
+        """Test the pool returns one record per image, errors included."""
+        results = process_images(str(image_folder), 300, workers=workers, chunksize=1)
+
+        by_name = {os.path.basename(result.path): result for result in results}
+        assert set(by_name) == {"big.jpg", "small.jpg", "broken.jpeg"}
+        assert all(isinstance(result, ImageResult) for result in results)
+        assert by_name["big.jpg"].status == "compressed"
+        assert by_name["small.jpg"].status == "skipped"
+        assert by_name["broken.jpeg"].status == "error"
+        assert by_name["broken.jpeg"].error
+
+    def test_process_image_raises_bugs(self, image_folder, monkeypatch):
+        """Test only file errors become "error" records, a bug in the pipeline is raised."""
+
+        def resize_image(*args):
+            raise TypeError("bug")
+
+        monkeypatch.setattr("pythonruns.src.mytests.resize_images.resize_image", resize_image)
+
+        with pytest.raises(TypeError):
+            process_image(str(image_folder / "big.jpg"), 300)
+
+    @pytest.mark.parametrize("budget_ratio", [0.9, 0.5, 0.2, 0.01])
+    def test_find_jpg_quality_matches_linear_search(self, photo, budget_ratio):
+        """Test bisection picks the highest fitting quality step, like the linear descent, in at most 5 encodes."""
+        sizes = {quality: len(encode_jpg(photo, "JPEG", quality)) / 1024 for quality in JPG_QUALITIES}
+        max_size_kb = sizes[95] * budget_ratio
+        fitting = [quality for quality, size in sizes.items() if size <= max_size_kb]
+
+        data, quality, encodes = find_jpg_quality(photo, "JPEG", max_size_kb)
+
+        assert quality == max(fitting, default=min(JPG_QUALITIES))
+        assert data == encode_jpg(photo, "JPEG", quality)
+        assert encodes <= 5
+
+    def test_find_jpg_quality_with_good_seed(self, photo):
+        """Test an exact seed is confirmed with its neighbour step only."""
+        max_size_kb = len(encode_jpg(photo, "JPEG", 60)) / 1024
+
+        _, quality, encodes = find_jpg_quality(photo, "JPEG", max_size_kb, seed=60)
+
+        assert quality == 60
+        assert encodes == 2
+
+    def test_process_images_uses_cache_on_rerun(self, image_folder):
+        """Test a second run over an unchanged folder skips the processed files."""
+        process_images(str(image_folder), 300, workers=1)
+        compressed_size = (image_folder / "big.jpg").stat().st_size
+
+        results = process_images(str(image_folder), 300, workers=1)
+
+        by_name = {os.path.basename(result.path): result for result in results}
+        assert by_name["big.jpg"].status == "cached"
+        assert by_name["big.jpg"].final_kb == pytest.approx(compressed_size / 1024)
+        assert by_name["small.jpg"].status == "cached"
+        assert by_name["broken.jpeg"].status == "error"
+
+    def test_cache_finds_moved_file_by_hash(self, image_folder):
+        """Test a renamed file is found by content hash, while a changed file is processed again."""
+        process_images(str(image_folder), 300, workers=1)
+        (image_folder / "big.jpg").rename(image_folder / "moved.jpg")
+        Image.new("RGB", (60, 60), "blue").save(image_folder / "small.jpg")
+
+        results = process_images(str(image_folder), 300, workers=1)
+
+        by_name = {os.path.basename(result.path): result for result in results}
+        assert by_name["moved.jpg"].status == "cached"
+        assert by_name["small.jpg"].status == "skipped"
+
+    def test_cache_hashes_only_files_of_a_cached_size(self, image_folder, monkeypatch):
+        """Test a new file whose size matches no cached file is a miss without being read."""
+        process_images(str(image_folder), 300, workers=1)
+        Image.new("RGB", (70, 70), "green").save(image_folder / "new.jpg")
+
+        def file_hash(path):
+            raise AssertionError(f"{path} hashed")
+
+        monkeypatch.setattr("pythonruns.src.mytests.resize_images.file_hash", file_hash)
+        cache = ImageCache(str(image_folder))
+        try:
+            assert cache.lookup(str(image_folder / "new.jpg"), cache_settings(300, png_lossy=True)) is None
+        finally:
+            cache.close()
+
+    def test_cache_depends_on_max_size(self, image_folder):
+        """Test a different size budget is not served from the cache."""
+        process_images(str(image_folder), 300, workers=1)
+
+        results = process_images(str(image_folder), 200, workers=1)
+
+        assert all(result.status != "cached" for result in results)
+
+    def test_resize_image_max_dimension(self, tmp_path):
+        """Test a large JPEG is downscaled to the max dimension before the quality search."""
+        path = tmp_path / "large.jpg"
+        rng = np.random.default_rng(3)
+        noise = rng.integers(0, 256, size=(150, 200, 3), dtype=np.uint8)
+        Image.fromarray(noise).resize((2000, 1500), Image.BILINEAR).save(path, quality=95)
+
+        result = resize_image(str(path), 100, max_dimension=800)
+
+        with Image.open(path) as img:
+            assert img.size == (800, 600)
+        assert result.status == "compressed"
+        assert result.final_kb <= 100
+
+    @pytest.mark.parametrize("mode", ["RGB", "P"])
+    def test_resize_image_max_dimension_png(self, tmp_path, mode):
+        """Test a large PNG, palette ones included, is downscaled to the max dimension too."""
+        path = tmp_path / "large.png"
+        rng = np.random.default_rng(5)
+        noise = rng.integers(0, 256, size=(150, 200, 3), dtype=np.uint8)
+        img = Image.fromarray(noise).resize((2000, 1500), Image.BILINEAR)
+        (img.quantize() if mode == "P" else img).save(path)
+
+        result = resize_image(str(path), 100, max_dimension=800)
+
+        with Image.open(path) as img:
+            assert img.size == (800, 600)
+        assert result.status == "compressed"
+
+    def test_target_size_from_budget(self, tmp_path):
+        """Test the size budget picks a smaller resolution, keeping the aspect ratio."""
+        path = tmp_path / "large.jpg"
+        Image.new("RGB", (4000, 3000), "gray").save(path)
+
+        with Image.open(path) as img:
+            assert target_size(img, 1000, 1000) == (4000, 3000)
+            width, height = target_size(img, 4000, 100, min_quality=60)
+
+        assert width < 4000 and width / height == pytest.approx(4 / 3, rel=0.01)
+
+    def test_lossless_palette_is_exact(self):
+        """Test an image with few colors gets a palette version with the very same pixels, alpha included."""
+        rng = np.random.default_rng(5)
+        colors = rng.integers(0, 256, size=(40, 4), dtype=np.uint8)
+        img = Image.fromarray(colors[rng.integers(0, 40, size=(64, 80))], "RGBA")
+
+        palette_img = lossless_palette(img)
+
+        assert palette_img.mode == "P"
+        assert np.array_equal(np.asarray(palette_img.convert("RGBA")), np.asarray(img))
+        assert lossless_palette(Image.fromarray(rng.integers(0, 256, size=(64, 80, 3), dtype=np.uint8))) is None
+
+    def test_resize_image_compresses_png(self, tmp_path):
+        """Test a badly compressed PNG is rewritten smaller, losslessly when it fits."""
+        path = tmp_path / "chart.png"
+        rng = np.random.default_rng(9)
+        colors = rng.integers(0, 256, size=(16, 3), dtype=np.uint8)
+        pixels = colors[rng.integers(0, 16, size=(50, 50))].repeat(8, axis=0).repeat(8, axis=1)
+        Image.fromarray(pixels).save(path, compress_level=0)
+        original_kb = path.stat().st_size / 1024
+
+        result = resize_image(str(path), original_kb / 2, png_lossy=False)
+
+        assert result.status == "compressed"
+        assert path.stat().st_size / 1024 == pytest.approx(result.final_kb)
+        with Image.open(path) as img:
+            assert np.array_equal(np.asarray(img.convert("RGB")), pixels)
+
+    def test_resize_image_keeps_png_color_key(self, color_key_png):
+        """Test the transparent color of an RGB PNG is still transparent in its palette version."""
+        path, alpha = color_key_png
+
+        result = resize_image(str(path), path.stat().st_size / 1024 / 2, png_lossy=False)
+
+        assert result.status == "compressed"
+        with Image.open(path) as img:
+            assert img.mode == "P"
+            assert np.array_equal(np.asarray(img.convert("RGBA"))[..., 3], alpha)
+
+    def test_quantize_png_keeps_color_key(self, color_key_png):
+        """Test the transparent color of an RGB PNG is still transparent once quantized."""
+        path, alpha = color_key_png
+
+        with Image.open(path) as img:
+            quantized = quantize_png(img)
+
+        buffer = io.BytesIO()
+        quantized.save(buffer, format="PNG")
+        with Image.open(buffer) as img:
+            assert np.array_equal(np.asarray(img.convert("RGBA"))[..., 3], alpha)
+
+    def test_resize_image_keeps_png_when_not_smaller(self, tmp_path):
+        """Test a PNG the optimizer can not shrink is left untouched."""
+        path = tmp_path / "noise.png"
+        rng = np.random.default_rng(11)
+        Image.fromarray(rng.integers(0, 256, size=(100, 100, 3), dtype=np.uint8)).save(path, optimize=True)
+        data = path.read_bytes()
+
+        result = resize_image(str(path), 1, png_lossy=False)
+
+        assert result.status == "unchanged"
+        assert path.read_bytes() == data
+
+    def test_convert_image_to_webp(self, tmp_path, photo):
+        """Test a JPEG is converted to a WEBP fitting the budget, next to the original."""
+        path = tmp_path / "photo.jpg"
+        photo.save(path, quality=95)
+        original = path.read_bytes()
+
+        result = convert_image(str(path), 150, "WEBP")
+
+        assert result.status == "converted"
+        assert result.final_kb <= 150
+        assert path.read_bytes() == original
+        with Image.open(tmp_path / "photo.jpg.webp") as img:
+            assert img.format == "WEBP" and img.size == photo.size
+
+    def test_convert_image_keeps_color_key(self, color_key_png):
+        """Test the transparent color of an RGB PNG is an alpha channel in its WEBP version."""
+        path, alpha = color_key_png
+
+        assert convert_image(str(path), 300, "WEBP").status == "converted"
+
+        with Image.open(f"{path}.webp") as img:
+            assert img.mode == "RGBA"
+            assert np.abs(np.asarray(img)[..., 3].astype(int) - alpha).mean() < 1
+
+    def test_convert_image_replace(self, image_folder):
+        """Test the original is removed when replacing, and a converted file is never bigger than the original."""
+        small = image_folder / "small.jpg"
+
+        result = convert_image(str(small), 300, "WEBP", replace=True)
+
+        assert result.status == "converted"
+        assert result.final_kb <= result.original_kb
+        assert not small.exists()
+        assert (image_folder / "small.webp").exists()
+
+    def test_perceptual_scores(self, photo):
+        """Test SSIM and PSNR are perfect on the same image and drop with the JPEG quality."""
+        reference = luma(photo)
+        low, high = (jpg_luma(encode_jpg(photo, "JPEG", quality)) for quality in (20, 90))
+
+        assert ssim(reference, reference) == pytest.approx(1.0)
+        assert psnr(reference, reference) == float("inf")
+        assert ssim(reference, low) < ssim(reference, high) < 1
+        assert psnr(reference, low) < psnr(reference, high)
+
+    def test_jpg_luma_matches_full_decode(self, large_photo):
+        """Test the grayscale decode of a large JPEG gives the luma of a full decode, on full resolution tiles."""
+        data = encode_jpg(large_photo, "JPEG", 90)
+
+        with Image.open(io.BytesIO(data)) as decoded:
+            full = luma(decoded)
+
+        assert full.shape == (SCORE_TILES**2, SCORE_TILE, SCORE_TILE)
+        assert jpg_luma(data).shape == full.shape
+        assert np.abs(jpg_luma(data) - full).mean() < 1
+
+    def test_blocked_encode_is_rejected(self, large_photo):
+        """Test the 8x8 blocks of a low quality encode of a large image bring its score under the floor."""
+        reference = luma(large_photo)
+
+        assert ssim(reference, jpg_luma(encode_jpg(large_photo, "JPEG", 15))) < 0.97
+
+        _, quality, _ = find_perceptual_quality(large_photo, "JPEG", 0.97)
+
+        assert quality > 15
+
+    @pytest.mark.parametrize("min_score", [0.9, 0.97, 0.995])
+    def test_find_perceptual_quality_matches_linear_search(self, photo, min_score):
+        """Test bisection picks the lowest quality step reaching the score, like a linear ascent."""
+        reference = luma(photo)
+        scores = {q: ssim(reference, jpg_luma(encode_jpg(photo, "JPEG", q))) for q in JPG_QUALITIES}
+        passing = [quality for quality, score in scores.items() if score >= min_score]
+
+        data, quality, encodes = find_perceptual_quality(photo, "JPEG", min_score)
+
+        assert quality == min(passing, default=max(JPG_QUALITIES))
+        assert data == encode_jpg(photo, "JPEG", quality)
+        assert encodes <= 5
+
+    def test_resize_image_min_score(self, tmp_path, photo):
+        """Test the perceptual mode writes the encoding reaching the score, whatever the size budget."""
+        path = tmp_path / "photo.jpg"
+        photo.save(path, quality=100)
+
+        result = resize_image(str(path), 10, min_score=0.95)
+
+        assert result.status == "compressed"
+        with Image.open(path) as img:
+            assert ssim(luma(photo), luma(img)) >= 0.95
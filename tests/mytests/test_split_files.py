@@ -0,0 +1,256 @@
+import bz2
+import gzip
+from itertools import pairwise
+
+import pytest
+
+from pythonruns.src.mytests.split_files import (
+    copy_range,
+    count_lines,
+    find_chunk_boundaries,
+    merge_files,
+    open_file,
+    parse_size,
+    split_file,
+)
+
+
+def reference_split(lines, num_chunks):
+    """Original in-memory chunking rules: equal chunks, the last one takes the remainder."""
+    chunk_size = len(lines) // num_chunks
+    chunks = []
+    for i in range(num_chunks):
+        start = i * chunk_size
+        end = start + chunk_size if i < num_chunks - 1 else None
+        chunks.append("".join(lines[start:end]))
+    return chunks
+
+
+@pytest.fixture
+def log_file(tmp_path, monkeypatch):
+    """Fixture for a small log file, run from a temp dir so the split logs stay there."""
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "app.log"
+    path.write_text("".join(f"2024-09-25 10:00:{i % 60:02d} line {i}\n" for i in range(103)))
+    return path
+
+
+class TestSplitFile:
+    """Test suite for split_file."""
+
+    def test_count_lines(self, log_file):
+        """Test counting lines without loading the file."""
+        assert count_lines(log_file) == 103
+
+    @pytest.mark.parametrize("num_chunks", [1, 3, 7, 200])
+    def test_split_by_lines_matches_reference(self, log_file, num_chunks):
+        """Test streaming split produces the same chunks as the in-memory version."""
+        expected = reference_split(log_file.read_text().splitlines(keepends=True), num_chunks)
+
+        split_file(str(log_file), num_chunks)
+
+        for i, chunk in enumerate(expected):
+            part = log_file.parent / f"app_part_{i + 1}.log"
+            assert part.read_text() == chunk
+
+    def test_split_without_trailing_newline(self, log_file):
+        """Test the last partial line ends up in the last chunk."""
+        log_file.write_text("a\nb\nc\nd\ne")
+
+        split_file(str(log_file), 2)
+
+        assert (log_file.parent / "app_part_1.log").read_text() == "a\nb\n"
+        assert (log_file.parent / "app_part_2.log").read_text() == "c\nd\ne"
+
+    def test_split_requires_one_mode(self, log_file):
+        """Test that exactly one of num_chunks or chunk_size is accepted."""
+        with pytest.raises(ValueError):
+            split_file(str(log_file))
+        with pytest.raises(ValueError):
+            split_file(str(log_file), 2, chunk_size=100)
+        with pytest.raises(ValueError):
+            split_file(str(log_file), 2, workers=4)
+        with pytest.raises(ValueError):
+            split_file(str(log_file), 2, record_start=r"\d{4}")
+
+    @pytest.mark.parametrize("zero_copy", [True, False])
+    def test_copy_range(self, tmp_path, zero_copy):
+        """Test copying a byte range with the kernel calls and with the buffered fallback."""
+        source = tmp_path / "source.bin"
+        source.write_bytes(bytes(range(256)) * 100)
+
+        copy_range(str(source), str(tmp_path / "out.bin"), 1000, 20000, zero_copy=zero_copy)
+
+        assert (tmp_path / "out.bin").read_bytes() == source.read_bytes()[1000:20000]
+
+    @pytest.mark.parametrize("text, expected", [("100", 100), ("4K", 4096), ("512M", 512 * 1024**2), ("1gb", 1024**3)])
+    def test_parse_size(self, text, expected):
+        """Test parsing human readable sizes."""
+        assert parse_size(text) == expected
+
+    def test_parse_size_invalid(self):
+        """Test parsing an invalid size."""
+        with pytest.raises(ValueError):
+            parse_size("lots")
+
+    def test_boundaries_are_line_aligned(self, log_file):
+        """Test every chunk boundary falls right after a newline."""
+        data = log_file.read_bytes()
+
+        boundaries = find_chunk_boundaries(str(log_file), 500)
+
+        assert boundaries[0] == 0 and boundaries[-1] == len(data)
+        assert boundaries == sorted(set(boundaries))
+        assert all(data[offset - 1 : offset] == b"\n" for offset in boundaries[1:-1])
+
+    def test_boundary_on_exact_line_start(self, tmp_path):
+        """Test a target landing exactly on a line start is kept as the boundary."""
+        path = tmp_path / "exact.log"
+        path.write_bytes(b"abcd\nefgh\nijkl\n")
+
+        assert find_chunk_boundaries(str(path), 5) == [0, 5, 10, 15]
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_split_by_size(self, log_file, workers):
+        """Test size mode writes parts that rebuild the original file."""
+        split_file(str(log_file), chunk_size=500, workers=workers)
+
+        parts = sorted(log_file.parent.glob("app_part_*.log"), key=lambda p: int(p.stem.rsplit("_", 1)[1]))
+        assert len(parts) > 1
+        assert b"".join(p.read_bytes() for p in parts) == log_file.read_bytes()
+        assert all(p.read_bytes().endswith(b"\n") for p in parts)
+
+    def test_split_by_size_keeps_records(self, tmp_path, monkeypatch):
+        """Test multi-line records are not cut in half when a record start regex is given."""
+        monkeypatch.chdir(tmp_path)
+        path = tmp_path / "trace.log"
+        records = [f"2024-09-25 ERROR {i}\n  at frame one\n  at frame two\n" for i in range(20)]
+        path.write_text("".join(records))
+
+        split_file(str(path), chunk_size=100, record_start=r"\d{4}-\d{2}-\d{2}")
+
+        for part in tmp_path.glob("trace_part_*.log"):
+            assert part.read_text().startswith("2024-09-25 ERROR")
+
+    def test_split_compressed_input_by_lines(self, log_file):
+        """Test a gzip input is decompressed on the fly and split with the same line rules."""
+        gz_file = log_file.parent / "app.log.gz"
+        gz_file.write_bytes(gzip.compress(log_file.read_bytes()))
+        expected = reference_split(log_file.read_text().splitlines(keepends=True), 3)
+
+        split_file(str(gz_file), 3)
+
+        for i, chunk in enumerate(expected):
+            assert (log_file.parent / f"app_part_{i + 1}.log").read_text() == chunk
+
+    def test_split_compressed_input_by_size(self, log_file):
+        """Test size mode on a compressed input cuts at the same offsets as on the plain file."""
+        data = log_file.read_bytes()
+        boundaries = find_chunk_boundaries(str(log_file), 500)
+        (log_file.parent / "app.log.bz2").write_bytes(bz2.compress(data))
+
+        split_file(str(log_file.parent / "app.log.bz2"), chunk_size=500)
+
+        for i, (start, end) in enumerate(pairwise(boundaries)):
+            assert (log_file.parent / f"app_part_{i + 1}.log").read_bytes() == data[start:end]
+
+    @pytest.mark.parametrize("compressed_input", [False, True])
+    @pytest.mark.parametrize("compress", ["gz", "bz2", "xz", "zst"])
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_split_with_compressed_output(self, log_file, workers, compress, compressed_input):
+        """Test every codec writes parts that decompress back to the whole file, from a plain or compressed input."""
+        if compress == "zst":
+            pytest.importorskip("zstandard")
+        source = log_file
+        if compressed_input:
+            source = log_file.parent / "app.log.gz"
+            source.write_bytes(gzip.compress(log_file.read_bytes()))
+
+        split_file(str(source), chunk_size=500, workers=workers, compress=compress)
+
+        parts = sorted(
+            log_file.parent.glob(f"app_part_*.log.{compress}"), key=lambda p: int(p.name.split("_")[2].split(".")[0])
+        )
+        assert len(parts) > 1
+        data = b""
+        for part in parts:
+            with open_file(str(part), "rb") as f:
+                data += f.read()
+        assert data == log_file.read_bytes()
+
+    def test_gzip_parts_concatenate(self, log_file):
+        """Test gzip parts concatenated are a valid multi-member gzip of the whole file."""
+        split_file(str(log_file), chunk_size=500, workers=2, compress="gz")
+
+        parts = sorted(log_file.parent.glob("app_part_*.log.gz"), key=lambda p: int(p.name.split("_")[2].split(".")[0]))
+        assert gzip.decompress(b"".join(p.read_bytes() for p in parts)) == log_file.read_bytes()
+
+    def test_split_unknown_codec(self, log_file):
+        """Test an unknown output codec is rejected."""
+        with pytest.raises(ValueError):
+            split_file(str(log_file), 2, compress="rar")
+
+
+class TestMergeFiles:
+    """Test suite for merge_files."""
+
+    @pytest.mark.parametrize("compress", [None, "gz"])
+    def test_merge_rebuilds_split_file(self, log_file, compress):
+        """Test splitting then merging gives back the original file."""
+        split_file(str(log_file), chunk_size=300, compress=compress)
+        merged = log_file.parent / "merged.log"
+
+        assert merge_files(str(log_file), str(merged)) == str(merged)
+        assert merged.read_bytes() == log_file.read_bytes()
+
+    def test_merge_orders_parts_numerically(self, tmp_path, monkeypatch):
+        """Test part 10 comes after part 9, not after part 1."""
+        monkeypatch.chdir(tmp_path)
+        for i in range(1, 12):
+            (tmp_path / f"app_part_{i}.log").write_text(f"{i}\n")
+
+        merge_files(str(tmp_path / "app.log"))
+
+        assert (tmp_path / "app.log").read_text() == "".join(f"{i}\n" for i in range(1, 12))
+
+    def test_merge_missing_part(self, tmp_path, monkeypatch):
+        """Test a gap in the part numbers is reported."""
+        monkeypatch.chdir(tmp_path)
+        for i in (1, 2, 4):
+            (tmp_path / f"app_part_{i}.log").write_text(f"{i}\n")
+
+        with pytest.raises(ValueError, match=r"\[3\]"):
+            merge_files(str(tmp_path / "app.log"))
+
+    def test_merge_no_parts(self, tmp_path):
+        """Test merging without parts."""
+        with pytest.raises(FileNotFoundError):
+            merge_files(str(tmp_path / "app.log"))
+
+    def test_merge_does_not_overwrite(self, log_file):
+        """Test the original file is not overwritten by default."""
+        split_file(str(log_file), 2)
+
+        with pytest.raises(FileExistsError):
+            merge_files(str(log_file))
+
+    def test_merge_by_timestamp(self, tmp_path, monkeypatch):
+        """Test parts from several hosts are interleaved by time, keeping multi-line records together."""
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "app_part_1.log").write_text(
+            "2024-09-25 10:00:01 host1 a\n2024-09-25 10:00:04 host1 b\n  at frame\n2024-09-25 10:00:05 host1 c\n"
+        )
+        (tmp_path / "app_part_2.log").write_text("2024-09-25 10:00:02 host2 a\n2024-09-25 10:00:06 host2 b\n")
+        (tmp_path / "app_part_3.log").write_text("2024-09-25 10:00:03 host3 a\n")
+
+        merge_files(str(tmp_path / "app.log"), by_timestamp=True)
+
+        assert (tmp_path / "app.log").read_text().splitlines() == [
+            "2024-09-25 10:00:01 host1 a",
+            "2024-09-25 10:00:02 host2 a",
+            "2024-09-25 10:00:03 host3 a",
+            "2024-09-25 10:00:04 host1 b",
+            "  at frame",
+            "2024-09-25 10:00:05 host1 c",
+            "2024-09-25 10:00:06 host2 b",
+        ]
@@ -0,0 +1,156 @@
+import sqlite3
+import time
+
+import pytest
+
+from pythonruns.src.mytests.database import (
+    persist_json_disk_to_db_visualize,
+    persist_json_to_db,
+    persist_json_to_db_visualize,
+    save_to_mem_db,
+)
+from pythonruns.src.mytests.database.sqlite_backend import (
+    GroupCommit,
+    connect,
+    database_path,
+)
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    """Fixture for a database file with a table, and a second connection to read what is committed."""
+    path = str(tmp_path / "test.db")
+    conn = connect(path)
+    conn.execute("CREATE TABLE data (id INTEGER PRIMARY KEY, info TEXT)")
+    conn.commit()
+    reader = sqlite3.connect(path)
+    yield conn, reader
+    reader.close()
+    conn.close()
+
+
+def committed(reader):
+    return reader.execute("SELECT COUNT(*) FROM data").fetchone()[0]
+
+
+class TestSqliteBackend:
+    """Test suite for the SQLite backend of the database demos."""
+
+    def test_database_path(self, tmp_path):
+        """Test one file per demo in the folder, or memory only."""
+        assert database_path("demo", str(tmp_path / "dbs")) == str(tmp_path / "dbs" / "demo.db")
+        assert (tmp_path / "dbs").is_dir()
+        assert database_path("demo", ":memory:") == ":memory:"
+
+    def test_connect_pragmas(self, db_file):
+        """Test the file is WAL journaled with the tuned pragmas."""
+        conn, _ = db_file
+
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -64 * 1024
+
+    def test_group_commit_window(self, db_file):
+        """Test the writes of a window are committed together by the timer."""
+        conn, reader = db_file
+        writes = GroupCommit(conn, window=0.05)
+
+        for i in range(10):
+            writes.execute("INSERT INTO data (info) VALUES (?)", (str(i),))
+        assert committed(reader) == 0
+
+        deadline = time.monotonic() + 5
+        while committed(reader) < 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert committed(reader) == 10 and writes.pending == 0
+
+    def test_group_commit_max_pending_and_flush(self, db_file):
+        """Test a full batch is committed right away, the rest on flush."""
+        conn, reader = db_file
+        writes = GroupCommit(conn, window=60, max_pending=4)
+
+        for i in range(6):
+            writes.execute("INSERT INTO data (info) VALUES (?)", (str(i),))
+        assert committed(reader) == 4
+
+        writes.close()
+        assert committed(reader) == 6
+
+    def test_group_commit_no_window(self, db_file):
+        """Test a window of 0 commits every write."""
+        conn, reader = db_file
+
+        GroupCommit(conn, window=0).execute("INSERT INTO data (info) VALUES ('a')")
+
+        assert committed(reader) == 1
+
+    def test_transaction(self, db_file):
+        """Test a transaction commits the pending writes first, and is rolled back on its own."""
+        conn, reader = db_file
+        writes = GroupCommit(conn, window=60)
+        writes.execute("INSERT INTO data (info) VALUES ('pending')")
+
+        with pytest.raises(ValueError), writes.transaction() as transaction:
+            transaction.execute("INSERT INTO data (info) VALUES ('rolled back')")
+            raise ValueError("Failed")
+
+        assert [row[0] for row in reader.execute("SELECT info FROM data")] == ["pending"]
+
+    def test_committed(self, db_file):
+        """Test the writes of a committed block are committed at its end, the later ones being left to the window."""
+        conn, reader = db_file
+        writes = GroupCommit(conn, window=60)
+
+        with writes.committed():
+            writes.execute("INSERT INTO data (info) VALUES ('a')")
+            writes.execute("INSERT INTO data (info) VALUES ('b')")
+            assert committed(reader) == 0
+        writes.execute("INSERT INTO data (info) VALUES ('c')")
+
+        assert committed(reader) == 2 and writes.pending == 1
+
+    def test_read_holds_lock(self, db_file):
+        """Test a read block holds the lock, so the timer thread waits for its end to commit."""
+        conn, reader = db_file
+        writes = GroupCommit(conn, window=0.01)
+        writes.execute("INSERT INTO data (info) VALUES ('a')")
+        timer = writes.timer
+
+        with writes.read() as read_conn:
+            time.sleep(0.1)
+            assert read_conn.execute("SELECT COUNT(*) FROM data").fetchone()[0] == 1
+            assert writes.pending == 1 and committed(reader) == 0
+
+        timer.join(5)
+        assert committed(reader) == 1
+
+    def test_append_is_batched(self, monkeypatch):
+        """Test a record added outside of the save button waits for the group commit window."""
+        monkeypatch.setattr(persist_json_to_db.writes, "window", 60)
+
+        persist_json_to_db.append_record({"info": "batched"})
+
+        assert persist_json_to_db.writes.pending == 1
+        persist_json_to_db.writes.flush()
+
+    @pytest.mark.parametrize(
+        "app", [save_to_mem_db, persist_json_to_db, persist_json_to_db_visualize, persist_json_disk_to_db_visualize]
+    )
+    def test_save_button_commits_before_success(self, app, monkeypatch):
+        """Test the demos report a save once it is committed, not while it waits for the group commit window."""
+        pending = []
+        monkeypatch.setattr(app.messagebox, "showinfo", lambda *args: pending.append(app.writes.pending))
+
+        class Entry:
+            def get(self):
+                return "from the app"
+
+            def delete(self, *args):
+                pass
+
+        monkeypatch.setattr(app, "entry", Entry(), raising=False)
+        monkeypatch.setattr(app.writes, "window", 60)
+
+        app.save_data()
+
+        assert pending == [0]
@@ -0,0 +1,103 @@
+import pytest
+
+from pythonruns.src.mytests.database.store_cache import StoreCache
+
+
+class Clock:
+    """Fake monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStoreCache:
+    """Test suite for the LRU/TTL write-through cache."""
+
+    def test_get_hits_and_misses(self):
+        """Test a value is loaded once, then read from the cache."""
+        cache = StoreCache()
+        loads = []
+
+        for _ in range(3):
+            assert cache.get("store", lambda: loads.append(1) or {"data": []}) == {"data": []}
+
+        assert len(loads) == 1
+        assert cache.stats() | {"hit_ratio": None} == {
+            "hits": 2,
+            "misses": 1,
+            "hit_ratio": None,
+            "evictions": 0,
+            "expirations": 0,
+            "writes": 0,
+            "size": 1,
+            "dirty": 0,
+        }
+
+    def test_lru_eviction(self):
+        """Test the least recently used value is evicted first."""
+        cache = StoreCache(maxsize=2)
+        cache.get("a", lambda: 1)
+        cache.get("b", lambda: 2)
+        cache.get("a", lambda: 0)  # "a" used last
+
+        cache.get("c", lambda: 3)
+
+        assert list(cache.entries) == ["a", "c"] and cache.evictions == 1
+
+    def test_ttl_expiration(self):
+        """Test a value older than the TTL is loaded again."""
+        clock = Clock()
+        cache = StoreCache(ttl=10, clock=clock)
+        cache.get("store", lambda: "old")
+
+        clock.now = 9
+        assert cache.get("store", lambda: "new") == "old"
+        clock.now = 10
+        assert cache.get("store", lambda: "new") == "new"
+        assert cache.expirations == 1
+
+    def test_write_through(self):
+        """Test a write saves first, then updates the cached value, the key being dirty in between."""
+        cache = StoreCache()
+        saved = []
+        cache.get("store", lambda: [1])
+
+        def save():
+            assert cache.dirty == {"store"}
+            assert cache.get("store", lambda: ["reloaded"]) == ["reloaded"]  # A dirty entry is never read
+            saved.append(2)
+            return 2
+
+        assert cache.write("store", save, lambda value, result: value + [result]) == 2
+
+        assert saved == [2] and cache.dirty == set()
+        assert cache.get("store", lambda: None) == ["reloaded", 2] and cache.writes == 1
+
+    def test_write_failure_drops_entry(self):
+        """Test a failed save leaves nothing stale in the cache."""
+        cache = StoreCache()
+        cache.get("store", lambda: [1])
+
+        def save():
+            raise ValueError("Database error")
+
+        with pytest.raises(ValueError):
+            cache.write("store", save, lambda value, result: value + [result])
+
+        assert "store" not in cache.entries and cache.dirty == set()
+
+    def test_invalidate(self):
+        """Test dropping some keys, the matching ones, or all of them."""
+        cache = StoreCache()
+        for key in ("store", ("find", "info", "a"), ("find", "info", "b")):
+            cache.get(key, lambda: 1)
+
+        cache.invalidate(("find", "info", "a"))
+        assert len(cache.entries) == 2
+        cache.invalidate_if(lambda key: key != "store")
+        assert list(cache.entries) == ["store"]
+        cache.invalidate()
+        assert not cache.entries